@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "horizonbouncer"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+HASH_CHUNK_BYTES = 1 << 20
+# One small file per audio path, so processes sharing the cache never overwrite each other's hashes
+HASH_DIR_NAME = "content_hashes"
+# Single-file hash index of earlier versions, deleted on open
+LEGACY_HASH_INDEX_NAME = "content_hashes.json"
+
+class AnalysisCache:
+    """
+    On-disk cache of per-segment band energies, stored as one .npz file per
+    (audio content, analysis parameters) pair. Entries are evicted least recently
+    used first once the cache grows past max_bytes; file mtimes track recency, so
+    several processes can share one cache directory.
+    """
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hash_directory = self.directory / HASH_DIR_NAME
+        self.hash_directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / LEGACY_HASH_INDEX_NAME).unlink(missing_ok=True)
+
+    def content_hash(self, audio_file):
+        """
+        Hashes the file's bytes. The hash is remembered per (path, size, mtime)
+        so unchanged files aren't read again on later runs.
+        """
+        path = os.path.abspath(audio_file)
+        stat = os.stat(path)
+        entry_path = self.hash_directory / f"{hashlib.blake2b(path.encode('utf-8'), digest_size=16).hexdigest()}.json"
+        try:
+            with open(entry_path) as f:
+                entry = json.load(f)
+            if entry[:3] == [path, stat.st_size, stat.st_mtime_ns]:
+                return entry[3]
+        except (OSError, ValueError, IndexError):
+            pass
+
+        digest = hashlib.blake2b(digest_size=20)
+        with open(path, "rb") as f:
+            while chunk := f.read(HASH_CHUNK_BYTES):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+
+        entry = [path, stat.st_size, stat.st_mtime_ns, content_hash]
+        self._atomic_write(entry_path, json.dumps(entry).encode("utf-8"))
+        return content_hash
+
+    def key(self, audio_file, **params):
+        """Cache key for an audio file analyzed with the given parameters (bpm, beat_division, ...)"""
+        params_blob = json.dumps(params, sort_keys=True).encode("utf-8")
+        params_hash = hashlib.blake2b(params_blob, digest_size=8).hexdigest()
+        return f"{self.content_hash(audio_file)}-{params_hash}"
+
+    def get(self, key):
+        """
+        Returns the cached (rate, beat_duration, samples_per_segment, bands) for key, or None
+        """
+        import numpy as np  # deferred so importing the cache for CLI defaults stays cheap
+
+        path = self.directory / f"{key}.npz"
+        try:
+            with np.load(path) as entry:
+                result = (
+                    int(entry["rate"]),
+                    float(entry["beat_duration"]),
+                    int(entry["samples_per_segment"]),
+                    entry["bands"],
+                )
+        except (OSError, KeyError, ValueError):
+            return None
+        os.utime(path)  # mark as recently used
+        return result
+
+    def put(self, key, rate, beat_duration, samples_per_segment, bands):
+        import numpy as np
+
+        with tempfile.TemporaryFile(dir=self.directory) as f:
+            np.savez(f, rate=rate, beat_duration=beat_duration,
+                     samples_per_segment=samples_per_segment, bands=bands)
+            f.seek(0)
+            self._atomic_write(self.directory / f"{key}.npz", f.read())
+        self.evict()
+
+    def evict(self):
+        """Deletes least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for path in self.directory.glob("*.npz"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # removed by another process
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        evicted = False
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            evicted = True
+        if evicted:
+            self.prune_hashes()
+
+    def prune_hashes(self):
+        """Deletes remembered content hashes no cache entry uses any more"""
+        used = {path.name.split("-", 1)[0] for path in self.directory.glob("*.npz")}
+        for entry_path in self.hash_directory.glob("*.json"):
+            try:
+                with open(entry_path) as f:
+                    content_hash = json.load(f)[3]
+            except (OSError, ValueError, IndexError):
+                content_hash = None
+            if content_hash not in used:
+                entry_path.unlink(missing_ok=True)
+
+    def _atomic_write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+class MemoryLRU:
+    """
+    Thread-safe in-memory LRU of values with a known size, evicting least recently
+    used entries once their sizes add up to more than max_bytes
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, nbytes), least recently used first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        with self._lock:
+            if nbytes > self.max_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[key] = (value, nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.bytes -= evicted_bytes
+
+    def stats(self):
+        return {"entries": len(self._entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses}
+
+def file_key(audio_file, *params):
+    """
+    Cheap key for a file's current contents, from its path, size and mtime instead
+    of a content hash. Good enough within one long-running process.
+    """
+    path = os.path.abspath(audio_file)
+    stat = os.stat(path)
+    return (path, stat.st_size, stat.st_mtime_ns, *params)
+
+class MemoryAnalysisCache:
+    """
+    AnalysisCache interface backed by a MemoryLRU, for long-running processes like
+    the analysis server. An optional on-disk AnalysisCache behind it is read on
+    misses and written through on puts.
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, backend=None):
+        self.lru = MemoryLRU(max_bytes)
+        self.backend = backend
+
+    def key(self, audio_file, **params):
+        return file_key(audio_file, json.dumps(params, sort_keys=True))
+
+    def get(self, key):
+        result = self.lru.get(key)
+        if result is None and self.backend is not None:
+            result = self.backend.get(self.backend.key(key[0], **json.loads(key[-1])))
+            if result is not None:
+                self.lru.put(key, result, result[3].nbytes)
+        return result
+
+    def put(self, key, rate, beat_duration, samples_per_segment, bands):
+        self.lru.put(key, (rate, beat_duration, samples_per_segment, bands), bands.nbytes)
+        if self.backend is not None:
+            self.backend.put(self.backend.key(key[0], **json.loads(key[-1])), rate, beat_duration,
+                             samples_per_segment, bands)
@@ -1,104 +1,690 @@
+import os
 import numpy as np
-import scipy.io.wavfile as wav
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import profiling
+from constants import ANALYSIS_ENGINES, BASS_BANDS, DEFAULT_DECIMATION_RATE, SMOOTHING_ALGOS
 from wav_validator import validate_wav_format
+from wav_stream import full_scale, open_wav, read_wav_header, iter_wav_blocks
+from quantile_sketch import QuantileSketch
 
 WAV_PATH = Path("mekurume.wav")
 
-def calculate_bass_thresholds(audio_file, bpm=160, beat_division=4):
+# Upper bound on samples handed to a single batched rfft call
+FFT_BLOCK_SAMPLES = 1 << 20
+
+# Stopband attenuation of the decimation anti-alias filter
+DECIMATION_ATTENUATION_DB = 60
+# Input frames filtered per step, keeps the polyphase windows cache sized
+DECIMATION_CHUNK_FRAMES = 1 << 16
+
+# Butterworth prototype order of the filter bank band-passes (each band is twice that)
+BASS_FILTER_ORDER = 4
+
+# Beat division at 60 bpm used for the onset envelope in estimate_bpm (20 ms frames)
+ONSET_DIVISION = 50
+# Multiples of the beat period used to refine the BPM estimate
+BPM_HARMONICS = 4
+# Half-period peaks this close to the best peak win over it (avoids half-tempo picks)
+OCTAVE_RATIO = 0.8
+
+def band_slices(frame_length, rate):
     """
-    Analyzes audio file for bass energy with focus on transients
+    Precomputes the rfft bin range (start, stop) of every bass band for a frame length.
+    Empty bands get an empty range so they sum to 0.
+    """
+    frequencies = np.fft.rfftfreq(frame_length, d=1/rate)
+    slices = []
+    for low, high in BASS_BANDS.values():
+        indices = np.flatnonzero((frequencies >= low) & (frequencies <= high))
+        slices.append((indices[0], indices[-1] + 1) if len(indices) else (0, 0))
+    return slices
+
+def frame_band_energies(frames, rate):
+    """
+    Runs one batched rfft over a 2D array of equally sized frames and
+    reduces it to an (n_frames, 3) array of sub/punch/upper band energies
+    """
+    slices = band_slices(frames.shape[-1], rate)
+    # Only the bins up to the top of the highest band are ever read
+    top_bin = max(stop for _, stop in slices)
+    fft_data = np.abs(np.fft.rfft(frames, axis=-1)[:, :top_bin])
+    bands = np.empty((len(frames), len(BASS_BANDS)))
+    for column, (start, stop) in enumerate(slices):
+        bands[:, column] = np.sum(fft_data[:, start:stop], axis=-1)
+    return bands
+
+def segment_band_energies(data, samples_per_segment, rate):
+    """
+    Frames a mono signal into segments and returns their band energies.
+    A trailing partial segment is kept if it is at least half a segment long.
+    """
+    n_full = len(data) // samples_per_segment
+    remainder = len(data) - n_full * samples_per_segment
+    # Reshaping the contiguous signal gives a strided view of the segments, no copy
+    frames = data[:n_full * samples_per_segment].reshape(n_full, samples_per_segment)
+
+    with profiling.stage("fft", samples=len(data)) as counts:
+        block_frames = max(1, FFT_BLOCK_SAMPLES // samples_per_segment)
+        blocks = [frame_band_energies(frames[i:i + block_frames], rate)
+                  for i in range(0, n_full, block_frames)]
+        if remainder and remainder >= samples_per_segment * 0.5:
+            blocks.append(frame_band_energies(data[None, n_full * samples_per_segment:], rate))
+        counts["segments"] = sum(map(len, blocks))
+
+    if not blocks:
+        return np.empty((0, len(BASS_BANDS)))
+    return np.concatenate(blocks)
+
+def energies_from_bands(bands):
     """
-    # Load and process audio file
-    rate, data = wav.read(audio_file)
+    Combines band energies into bass energy with punch emphasis, plus the
+    transient energy (rise from the previous segment, lagged by one segment)
+    """
+    sub_bass, punch_bass, upper_bass = bands.T
+    bass_energies = punch_bass + 0.5 * sub_bass + 0.3 * upper_bass
+
+    transient_energies = np.zeros(len(bass_energies))
+    transient_energies[2:] = np.maximum(0, bass_energies[1:-1] - bass_energies[:-2])
+    return bass_energies, transient_energies
+
+def segment_times(n_segments, samples_per_segment, rate, beat_duration):
+    """Returns (time_seconds, beat_numbers) arrays for the start of every segment"""
+    time_seconds = np.arange(n_segments) * samples_per_segment / rate
+    return time_seconds, time_seconds / beat_duration
+
+def segment_timestamps(n_segments, samples_per_segment, rate, beat_duration):
+    """Builds the per-segment timestamp dicts"""
+    time_seconds, beat_numbers = segment_times(n_segments, samples_per_segment, rate, beat_duration)
+    return [
+        {
+            'time_seconds': timestamp_seconds,
+            'beat': beat_number,
+            'beat_fraction': beat_number % 1,
+            'segment_index': i
+        }
+        for i, (timestamp_seconds, beat_number) in enumerate(zip(time_seconds.tolist(), beat_numbers.tolist()))
+    ]
+
+# Percentile behind every threshold key
+THRESHOLD_PERCENTILES = {'min': 5, 'low': 25, 'mid': 50, 'high': 75, 'max': 95}
+
+def calculate_thresholds(energies):
+    """
+    Percentile thresholds used for normalization, from an energy array or a
+    QuantileSketch (e.g. one merged over several tracks). All five come from one pass.
+    """
+    if isinstance(energies, QuantileSketch):
+        values = energies.percentile(list(THRESHOLD_PERCENTILES.values()))
+    else:
+        values = np.percentile(energies, list(THRESHOLD_PERCENTILES.values()))
+    return dict(zip(THRESHOLD_PERCENTILES, values))
+
+def threshold_sketch(energies=(), exact=False):
+    """QuantileSketch for thresholds, seeded with energies; update it chunk by chunk or merge it with others"""
+    return QuantileSketch(exact=exact).update(energies)
+
+# In-memory LRU (analysis_cache.MemoryLRU) of decoded WAVs, set by long-running
+# processes like server.py so repeat requests skip the decode
+decoded_audio = None
+
+def _cached_audio(audio_file, layout):
+    """(key, cached (rate, data) or None) for a decoded file, or (None, None) without a cache"""
+    if decoded_audio is None or hasattr(audio_file, "read"):
+        return None, None
+    from analysis_cache import file_key
+
+    key = file_key(audio_file, layout)
+    with profiling.stage("decoded_audio_lookup") as counts:
+        cached = decoded_audio.get(key)
+        counts["hit"] = int(cached is not None)
+    return key, cached
+
+def _store_audio(key, rate, data):
+    if key is not None:
+        data.flags.writeable = False  # shared between requests from now on
+        decoded_audio.put(key, (rate, data), data.nbytes)
+    return rate, data
+
+def load_mono(audio_file):
+    """Loads a WAV file and downmixes it to mono"""
+    key, cached = _cached_audio(audio_file, "mono")
+    if cached is not None:
+        return cached
+    with profiling.stage("import_scipy"):
+        import scipy.io.wavfile as wav  # deferred, scipy.io takes a while to import
+
+    with profiling.stage("decode") as counts:
+        rate, data = wav.read(audio_file)
+        counts["samples"] = data.size
     is_valid, warnings = validate_wav_format(rate, data)
-    
+
     # Handle stereo
     if len(data.shape) > 1:
-        data = np.mean(data, axis=1)
-    
-    # Calculate granularity
+        with profiling.stage("downmix", channels=data.shape[1]):
+            data = np.mean(data, axis=1)
+    return _store_audio(key, rate, data)
+
+def load_channels(audio_file):
+    """Loads a WAV file keeping every channel, as a (samples, channels) array"""
+    key, cached = _cached_audio(audio_file, "channels")
+    if cached is not None:
+        return cached
+    with profiling.stage("import_scipy"):
+        import scipy.io.wavfile as wav
+
+    with profiling.stage("decode") as counts:
+        rate, data = wav.read(audio_file)
+        counts["samples"] = data.size
+    is_valid, warnings = validate_wav_format(rate, data)
+    return _store_audio(key, rate, data.reshape(len(data), -1))
+
+def thread_map(function, items, workers=None):
+    """
+    Maps function over items in a thread pool, keeping the order. NumPy's FFT
+    releases the GIL, so per-channel analysis runs on several cores at once.
+    """
+    items = list(items)
+    workers = workers or min(len(items), os.cpu_count() or 1)
+    if workers <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(profiling.run_in_context(function), items))
+
+def channel_band_energies(data, samples_per_segment, rate, workers=None):
+    """
+    segment_band_energies for every column of a (samples, channels) array, one thread
+    per channel. Columns are strided views, so no channel is copied out up front.
+    """
+    return thread_map(lambda channel: segment_band_energies(data[:, channel], samples_per_segment, rate),
+                      range(data.shape[1]), workers)
+
+class BassDecimator:
+    """
+    Anti-aliased decimation plus segment analysis for one signal, fed block by block.
+
+    A linear-phase FIR lowpass (Kaiser window, evaluated polyphase so only the kept
+    samples are computed) passes the bass bands and rejects everything that would
+    alias into them, then every factor-th sample is kept. The filter delay is
+    compensated, so decimated sample k lines up with input sample k * factor and
+    segments keep their full-rate boundaries. Band energies are scaled by the frame
+    length ratio to stay comparable with full-rate FFT magnitudes.
+
+    Multi-channel blocks are filtered per channel and downmixed after decimation,
+    which equals downmixing first but touches far less memory.
+    """
+    def __init__(self, rate, samples_per_segment, target_rate=DEFAULT_DECIMATION_RATE):
+        with profiling.stage("import_scipy_signal"):
+            import scipy.signal  # deferred, only needed when decimating
+
+        top_hz = max(high for _, high in BASS_BANDS.values())
+        self.rate = rate
+        self.factor = max(1, int(rate // target_rate))
+        self.decimated_rate = rate / self.factor
+        # Everything above decimated_rate - top_hz folds back into the bands
+        if self.decimated_rate - top_hz <= top_hz:
+            raise ValueError(f"Target rate {target_rate} Hz is too low to keep bass up to {top_hz} Hz")
+        self.samples_per_segment = samples_per_segment
+        self.frame_length = samples_per_segment // self.factor
+        if self.frame_length < 2:
+            raise ValueError(f"Segments of {samples_per_segment} samples are too short to decimate by {self.factor}")
+
+        if self.factor == 1:
+            taps = np.ones(1)
+        else:
+            width = (self.decimated_rate - 2 * top_hz) / (rate / 2)
+            numtaps, beta = scipy.signal.kaiserord(DECIMATION_ATTENUATION_DB, width)
+            numtaps |= 1  # odd, so the delay is a whole number of samples
+            taps = scipy.signal.firwin(numtaps, self.decimated_rate / 2, window=('kaiser', beta), fs=rate)
+        self.taps = taps[::-1].copy()  # reversed, windows are dotted with it directly
+        self.delay = (len(taps) - 1) // 2
+
+        self._input = None  # input from the start of the next filter window, zero history in front
+        self._n_input = 0
+        self._decimated = np.empty(0)  # decimated samples not framed yet
+        self._decimated_start = 0  # index of self._decimated[0] in the whole decimated signal
+        self._n_segments = 0
+
+    def _filter(self, data):
+        """Appends input and returns the decimated samples whose filter windows are complete"""
+        data = np.asarray(data, dtype=np.float64).reshape(len(data), -1)
+        if self._input is None:
+            self._input = np.zeros((self.delay, data.shape[1]))
+        buffer = np.concatenate([self._input, data])
+        n_taps = len(self.taps)
+        n_out = (len(buffer) - n_taps) // self.factor + 1 if len(buffer) >= n_taps else 0
+
+        step = max(1, DECIMATION_CHUNK_FRAMES // self.factor)
+        out = np.empty((n_out, buffer.shape[1]))
+        for start in range(0, n_out, step):
+            stop = min(n_out, start + step)
+            windows = np.lib.stride_tricks.sliding_window_view(
+                buffer[start * self.factor:(stop - 1) * self.factor + n_taps], n_taps, axis=0)[::self.factor]
+            out[start:stop] = windows @ self.taps
+        self._input = buffer[n_out * self.factor:]
+        return out.mean(axis=1) if out.shape[1] > 1 else out[:, 0]
+
+    def _frame(self, n_segments):
+        """Band energies of the next n_segments segments, from the decimated buffer"""
+        segment_index = self._n_segments + np.arange(n_segments)
+        starts = -(-segment_index * self.samples_per_segment // self.factor) - self._decimated_start
+        frames = self._decimated[starts[:, None] + np.arange(self.frame_length)]
+        self._n_segments += n_segments
+        return frame_band_energies(frames, self.decimated_rate) * (self.samples_per_segment / self.frame_length)
+
+    def _ready_segments(self):
+        # Whole segments in the input whose decimated frame is complete
+        segment_index = np.arange(self._n_segments, self._n_input // self.samples_per_segment)
+        frame_ends = -(-segment_index * self.samples_per_segment // self.factor) + self.frame_length
+        return int(np.count_nonzero(frame_ends <= self._decimated_start + len(self._decimated)))
+
+    def _drop_framed(self):
+        next_start = -(-self._n_segments * self.samples_per_segment // self.factor)
+        drop = min(next_start - self._decimated_start, len(self._decimated))
+        if drop > 0:
+            self._decimated = self._decimated[drop:]
+            self._decimated_start += drop
+
+    def feed(self, data):
+        """Adds a block of samples, (frames,) or (frames, channels), returns the bands of the segments it completed"""
+        with profiling.stage("decimate", samples=len(data)):
+            self._n_input += len(data)
+            self._decimated = np.concatenate([self._decimated, self._filter(data)])
+        with profiling.stage("fft") as counts:
+            bands = self._frame(self._ready_segments())
+            counts["segments"] = len(bands)
+        self._drop_framed()
+        return bands
+
+    def finish(self):
+        """
+        Flushes the filter and returns the remaining bands, including a trailing partial
+        segment kept under the same rule as segment_band_energies
+        """
+        if self._input is None:
+            return np.empty((0, len(BASS_BANDS)))
+        n_input = self._n_input
+        # Zeros after the end, like the zeros before the start, let the last windows complete
+        tail = self._filter(np.zeros((len(self.taps), self._input.shape[1])))
+        n_decimated = -(-n_input // self.factor)
+        self._decimated = np.concatenate([self._decimated, tail])[:n_decimated - self._decimated_start]
+
+        blocks = [self._frame(n_input // self.samples_per_segment - self._n_segments)]
+        remainder = n_input - self._n_segments * self.samples_per_segment
+        if remainder and remainder >= self.samples_per_segment * 0.5:
+            start = -(-self._n_segments * self.samples_per_segment // self.factor) - self._decimated_start
+            frame = self._decimated[None, start:]
+            if frame.shape[1]:
+                blocks.append(frame_band_energies(frame, self.decimated_rate) * (remainder / frame.shape[1]))
+        return np.concatenate(blocks)
+
+def decimated_band_energies(data, samples_per_segment, rate, target_rate=DEFAULT_DECIMATION_RATE):
+    """
+    segment_band_energies on a bass-band decimated copy of data, which can still have
+    its channels (they're downmixed after decimation). The input is filtered in
+    blocks, so no full-size float copy of the signal is made.
+    """
+    decimator = BassDecimator(rate, samples_per_segment, target_rate)
+    blocks = [decimator.feed(data[start:start + FFT_BLOCK_SAMPLES])
+              for start in range(0, len(data), FFT_BLOCK_SAMPLES)]
+    blocks.append(decimator.finish())
+    return np.concatenate(blocks)
+
+class BassFilterBank:
+    """
+    Streaming band energy engine: Butterworth band-pass filters (second-order
+    sections) for the sub/punch/upper bands run continuously over the signal, with
+    their state carried from block to block, and every segment gets the energy of
+    the filtered output inside it. Unlike per-segment FFTs the band edges don't
+    depend on the segment length, and there is no leakage across segment edges.
+
+    Energies are sqrt(N/2 * sum of squares) over a segment of N samples, which equals
+    the FFT engine's magnitude sum for a pure tone, so both engines' values are on a
+    comparable scale. With target_rate the signal is first decimated by a
+    BassDecimator's filter and the band-passes run at the low rate.
+    """
+    def __init__(self, rate, samples_per_segment, target_rate=None):
+        with profiling.stage("import_scipy_signal"):
+            import scipy.signal  # deferred, only needed by this engine
+
+        self.rate = rate
+        self.samples_per_segment = samples_per_segment
+        self.decimator = BassDecimator(rate, samples_per_segment, target_rate) if target_rate else None
+        self.factor = self.decimator.factor if self.decimator else 1
+        self.sos = [scipy.signal.butter(BASS_FILTER_ORDER, band, btype='bandpass', fs=rate / self.factor, output='sos')
+                    for band in BASS_BANDS.values()]
+        self._zi = [np.zeros((len(sos), 2)) for sos in self.sos]
+        self._sosfilt = scipy.signal.sosfilt
+
+        self._n_input = 0
+        self._power = np.empty((len(BASS_BANDS), 0))  # filtered power since the start of the open segment
+        self._power_start = 0  # index of self._power[:, 0] in the whole filtered signal
+        self._n_segments = 0
+
+    def _segment_start(self, index):
+        # First filtered sample of a segment, ceil so decimated segments tile the signal
+        return -(-index * self.samples_per_segment // self.factor)
+
+    def _bands(self, sums, lengths):
+        # Filtered power sums to energies in FFT units, scaled back up to the full rate
+        return np.sqrt(np.asarray(lengths)[:, None] / 2 * self.factor * sums)
+
+    def _add(self, signal):
+        """Filters more signal and returns the bands of the segments it completed"""
+        power = np.empty((len(self.sos), len(signal)))
+        for band, sos in enumerate(self.sos):
+            filtered, self._zi[band] = self._sosfilt(sos, signal, zi=self._zi[band])
+            np.square(filtered, out=power[band])
+        self._power = np.concatenate([self._power, power], axis=1)
+
+        # Segment k is complete once the filtered signal reaches the start of segment k + 1
+        end = self._power_start + self._power.shape[1]
+        n_complete = min(end * self.factor // self.samples_per_segment, self._n_input // self.samples_per_segment)
+        if n_complete <= self._n_segments:
+            return np.empty((0, len(BASS_BANDS)))
+        starts = self._segment_start(np.arange(self._n_segments, n_complete + 1)) - self._power_start
+        sums = np.add.reduceat(self._power[:, :starts[-1]], starts[:-1], axis=1).T
+        self._n_segments = n_complete
+        self._power = self._power[:, starts[-1]:]
+        self._power_start += starts[-1]
+        return self._bands(sums, np.full(len(sums), self.samples_per_segment))
+
+    def feed(self, data):
+        """Adds a block of samples, (frames,) or (frames, channels), returns the bands of the segments it completed"""
+        self._n_input += len(data)
+        if self.decimator is not None:
+            with profiling.stage("decimate", samples=len(data)):
+                signal = self.decimator._filter(data)
+        else:
+            with profiling.stage("downmix"):
+                data = np.asarray(data, dtype=np.float64)
+                signal = data.mean(axis=1) if data.ndim > 1 else data
+        with profiling.stage("filter_bank", samples=len(signal)) as counts:
+            bands = self._add(signal)
+            counts["segments"] = len(bands)
+        return bands
+
+    def finish(self):
+        """Returns the trailing partial segment, kept under the same rule as segment_band_energies"""
+        blocks = [np.empty((0, len(BASS_BANDS)))]
+        if self.decimator is not None and self.decimator._input is not None:
+            # Flush the decimation filter up to the last input sample
+            tail = self.decimator._filter(np.zeros((len(self.decimator.taps), self.decimator._input.shape[1])))
+            n_filtered = -(-self._n_input // self.factor)
+            blocks.append(self._add(tail[:n_filtered - self._power_start - self._power.shape[1]]))
+        remainder = self._n_input - self._n_segments * self.samples_per_segment
+        if remainder and remainder >= self.samples_per_segment * 0.5 and self._power.shape[1]:
+            blocks.append(self._bands(self._power.sum(axis=1)[None], [remainder]))
+        return np.concatenate(blocks)
+
+def filter_bank_band_energies(data, samples_per_segment, rate, target_rate=None):
+    """
+    Band energies of a (samples,) or (samples, channels) signal from the IIR filter
+    bank engine, fed in blocks so no full-size float copy of the signal is made.
+    """
+    filter_bank = BassFilterBank(rate, samples_per_segment, target_rate)
+    blocks = [filter_bank.feed(data[start:start + FFT_BLOCK_SAMPLES])
+              for start in range(0, len(data), FFT_BLOCK_SAMPLES)]
+    blocks.append(filter_bank.finish())
+    return np.concatenate(blocks)
+
+def signal_band_energies(data, samples_per_segment, rate, engine='fft', target_rate=None):
+    """
+    Band energies of an in-memory signal with the given engine. data keeps its
+    channels for the decimating and filter bank paths, which downmix on their own.
+    """
+    if engine == 'iir':
+        return filter_bank_band_energies(data, samples_per_segment, rate, target_rate)
+    if target_rate:
+        return decimated_band_energies(data, samples_per_segment, rate, target_rate)
+    if data.ndim > 1:
+        with profiling.stage("downmix", channels=data.shape[1]):
+            data = np.mean(data, axis=1) if data.shape[1] > 1 else data[:, 0]
+    return segment_band_energies(data, samples_per_segment, rate)
+
+def segment_length(rate, bpm, beat_division):
+    """Returns (beat_duration, samples_per_segment) for the given granularity"""
     beat_duration = 60 / bpm  # Duration of a beat in seconds
-    segment_duration = beat_duration / beat_division  
-    samples_per_segment = int(rate * segment_duration)
-    
-    bass_energies = []
-    transient_energies = []  # New array for storing transient energy
-    timestamps = []
-    
-    # Calculate bass energy for each segment
-    for i in range(0, len(data), samples_per_segment):
-        segment_frame = data[i:i + samples_per_segment]
-        if len(segment_frame) < samples_per_segment * 0.5:
-            break
-            
-        fft_data = np.abs(np.fft.rfft(segment_frame))
-        frequencies = np.fft.rfftfreq(len(segment_frame), d=1/rate)
-        
-        # Calculate bass energy - focusing on key frequency bands
-        # Sub-bass (20-60 Hz)
-        sub_indices = (frequencies >= 20) & (frequencies <= 60)
-        sub_bass = np.sum(fft_data[sub_indices]) if any(sub_indices) else 0
-        
-        # Punchy bass (60-120 Hz)
-        punch_indices = (frequencies >= 60) & (frequencies <= 120)
-        punch_bass = np.sum(fft_data[punch_indices]) if any(punch_indices) else 0
-        
-        # Upper bass (120-250 Hz)
-        upper_indices = (frequencies >= 120) & (frequencies <= 250)
-        upper_bass = np.sum(fft_data[upper_indices]) if any(upper_indices) else 0
-        
-        # Calculate bass transients by detecting rapid changes
-        if len(bass_energies) > 0:
-            # Calculate the rate of change from previous segment
-            prev_energy = bass_energies[-1]
-            current_energy = punch_bass + 0.5 * sub_bass + 0.3 * upper_bass
-            
-            # Weight punch frequencies more heavily
-            transient = max(0, current_energy - prev_energy)
-            transient_energies.append(transient)
+    segment_duration = beat_duration / beat_division
+    return beat_duration, int(rate * segment_duration)
+
+def stream_band_energies(audio_file, bpm=160, beat_division=4, block_segments=None, target_rate=None, engine='fft'):
+    """
+    Streaming counterpart of load_mono + segment_band_energies. Reads the WAV in
+    segment-aligned blocks and downmixes and analyzes one block at a time, so peak
+    memory is bounded by the block size instead of the track length.
+    audio_file can be a path or a binary file object (e.g. a pipe).
+    With target_rate or the iir engine the blocks go through a BassDecimator or a
+    BassFilterBank instead, which carry their filter state across blocks.
+
+    Returns:
+        tuple: (rate, beat_duration, samples_per_segment, bands)
+    """
+    with open_wav(audio_file) as fid, profiling.stage("stream_decode_fft") as counts:
+        header = read_wav_header(fid)
+        rate = header["rate"]
+        beat_duration, samples_per_segment = segment_length(rate, bpm, beat_division)
+        if block_segments is None:
+            block_segments = max(1, FFT_BLOCK_SAMPLES // samples_per_segment)
+
+        if engine == 'iir':
+            analyzer = BassFilterBank(rate, samples_per_segment, target_rate)
         else:
-            # First segment has no previous for comparison
-            current_energy = punch_bass + 0.5 * sub_bass + 0.3 * upper_bass
-            transient_energies.append(0)
-        
-        # Total bass energy with punch emphasis
-        bass_energy = punch_bass + 0.5 * sub_bass + 0.3 * upper_bass
-        bass_energies.append(bass_energy)
-        
-        # Store timestamp for this segment
-        timestamp_seconds = i / rate
-        beat_number = timestamp_seconds / beat_duration
-        timestamps.append({
-            'time_seconds': timestamp_seconds,
-            'beat': beat_number,
-            'beat_fraction': beat_number % 1,
-            'segment_index': len(bass_energies) - 1
-        })
-    
-    # Shift transient_energies to align with bass_energies
-    transient_energies = np.array([0] + transient_energies[:-1])
-    
-    # Calculate thresholds for both energy types
-    bass_energies = np.array(bass_energies)
-    transient_energies = np.array(transient_energies)
-    
-    bass_thresholds = {
-        'min': np.percentile(bass_energies, 5),
-        'low': np.percentile(bass_energies, 25),
-        'mid': np.percentile(bass_energies, 50),
-        'high': np.percentile(bass_energies, 75),
-        'max': np.percentile(bass_energies, 95)
+            analyzer = BassDecimator(rate, samples_per_segment, target_rate) if target_rate else None
+        blocks = []
+        for data in iter_wav_blocks(fid, header, block_segments * samples_per_segment):
+            if not blocks:
+                is_valid, warnings = validate_wav_format(rate, data, bit_depth=header["bit_depth"])
+            if analyzer is not None:
+                blocks.append(analyzer.feed(data))
+                continue
+            # Handle stereo
+            if len(data.shape) > 1:
+                data = np.mean(data, axis=1)
+            # Every block but the last is a whole number of segments
+            blocks.append(segment_band_energies(data, samples_per_segment, rate))
+        if analyzer is not None:
+            blocks.append(analyzer.finish())
+        counts["segments"] = sum(map(len, blocks))
+
+    bands = np.concatenate(blocks) if blocks else np.empty((0, len(BASS_BANDS)))
+    return rate, beat_duration, samples_per_segment, bands
+
+def calculate_band_energies(audio_file, bpm=160, beat_division=4, stream=False, cache=None, target_rate=None,
+                            engine='fft'):
+    """
+    Decodes the audio file and computes per-segment sub/punch/upper band energies
+
+    Args:
+        cache: Optional AnalysisCache; on a hit decoding and FFT are skipped entirely
+        target_rate: Decimate to about this sample rate before the FFTs (see BassDecimator)
+        engine: 'fft' for per-segment FFTs or 'iir' for the continuous filter bank (see BassFilterBank)
+
+    Returns:
+        tuple: (rate, beat_duration, samples_per_segment, bands)
+    """
+    if engine not in ANALYSIS_ENGINES:
+        raise ValueError(f"Unknown analysis engine {engine!r}, valid engines: {', '.join(ANALYSIS_ENGINES)}")
+    if cache is not None and not hasattr(audio_file, "read"):
+        with profiling.stage("cache_lookup") as counts:
+            # Options only join the key when not the default, so plain FFT entries keep their keys
+            options = {"target_rate": target_rate} if target_rate else {}
+            if engine != 'fft':
+                options["engine"] = engine
+            key = cache.key(audio_file, bpm=bpm, beat_division=beat_division, **options)
+            cached = cache.get(key)
+            counts["hit"] = int(cached is not None)
+        if cached is not None:
+            return cached
+        result = calculate_band_energies(audio_file, bpm=bpm, beat_division=beat_division, stream=stream,
+                                         target_rate=target_rate, engine=engine)
+        with profiling.stage("cache_store"):
+            cache.put(key, *result)
+        return result
+
+    if stream:
+        return stream_band_energies(audio_file, bpm=bpm, beat_division=beat_division, target_rate=target_rate,
+                                    engine=engine)
+
+    if target_rate or engine != 'fft':
+        # Decimation and the filter bank downmix on their own, block by block, so keep the channels
+        rate, data = load_channels(audio_file)
+        beat_duration, samples_per_segment = segment_length(rate, bpm, beat_division)
+        bands = signal_band_energies(data, samples_per_segment, rate, engine, target_rate)
+        return rate, beat_duration, samples_per_segment, bands
+
+    rate, data = load_mono(audio_file)
+    beat_duration, samples_per_segment = segment_length(rate, bpm, beat_division)
+    bands = segment_band_energies(data, samples_per_segment, rate)
+    return rate, beat_duration, samples_per_segment, bands
+
+def correlation(a, b):
+    """Pearson correlation, None when either series is constant (e.g. a band with no FFT bins)"""
+    if np.ptp(a) == 0 or np.ptp(b) == 0:
+        return None
+    return float(np.corrcoef(a, b)[0, 1])
+
+def validate_decimation(audio_file, bpm=160, beat_division=4, target_rate=DEFAULT_DECIMATION_RATE,
+                        threshold_vals=('min', 'max'), transient_focus=0.9, rounding=1):
+    """
+    Runs the full-rate and the decimated analysis side by side and reports how far
+    the decimated band energies and normalized values drift from the full-rate ones.
+
+    Timings cover the downmix and band energy analysis, not the shared decode.
+    Band errors are relative to the band's mean energy, so quiet segments don't blow
+    them up. value_changes counts segments whose normalized value rounds differently.
+
+    Returns:
+        dict: timings, speedup, per-band error stats and normalized value differences
+    """
+    import time
+
+    # Decode once and time only the analysis, the decode is the same for both paths
+    rate, data = load_channels(audio_file)
+    beat_duration, samples_per_segment = segment_length(rate, bpm, beat_division)
+    decimator = BassDecimator(rate, samples_per_segment, target_rate)  # also pays the scipy.signal import
+    start = time.perf_counter()
+    full = segment_band_energies(np.mean(data, axis=1) if data.shape[1] > 1 else data[:, 0],
+                                 samples_per_segment, rate)
+    full_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    decimated = decimated_band_energies(data, samples_per_segment, rate, target_rate)
+    decimated_seconds = time.perf_counter() - start
+
+    report = {
+        "file": str(audio_file),
+        "rate": rate,
+        "decimated_rate": decimator.decimated_rate,
+        "factor": decimator.factor,
+        "filter_taps": len(decimator.taps),
+        "frame_length": samples_per_segment,
+        "decimated_frame_length": decimator.frame_length,
+        "segments": len(full),
+        "full_seconds": full_seconds,
+        "decimated_seconds": decimated_seconds,
+        "speedup": full_seconds / decimated_seconds,
+        "bands": {},
     }
-    
-    transient_thresholds = {
-        'min': np.percentile(transient_energies, 5),
-        'low': np.percentile(transient_energies, 25),
-        'mid': np.percentile(transient_energies, 50),
-        'high': np.percentile(transient_energies, 75),
-        'max': np.percentile(transient_energies, 95)
+    for column, band in enumerate(BASS_BANDS):
+        error = np.abs(decimated[:, column] - full[:, column]) / max(np.mean(full[:, column]), np.finfo(float).tiny)
+        report["bands"][band] = {
+            "median_error": float(np.median(error)),
+            "p95_error": float(np.percentile(error, 95)),
+            "max_error": float(np.max(error)),
+            "correlation": correlation(decimated[:, column], full[:, column]),
+        }
+
+    options = dict(beat_division=beat_division, threshold_vals=threshold_vals,
+                   smoothing_algo='none', transient_focus=transient_focus)
+    full_values = bass_data_from_bands(full, rate, beat_duration, samples_per_segment, **options)['normalized_values']
+    decimated_values = bass_data_from_bands(decimated, rate, beat_duration, samples_per_segment, **options)['normalized_values']
+    difference = np.abs(decimated_values - full_values)
+    report["normalized_values"] = {
+        "mean_difference": float(np.mean(difference)),
+        "max_difference": float(np.max(difference)),
+        "value_changes": int(np.count_nonzero(np.round(decimated_values, rounding) != np.round(full_values, rounding))),
     }
-    
+    return report
+
+def stream_channel_band_energies(audio_file, bpm=160, beat_division=4, block_segments=None, workers=None):
+    """
+    Per-channel counterpart of stream_band_energies: every block is analyzed one
+    thread per channel instead of being downmixed.
+
+    Returns:
+        tuple: (rate, beat_duration, samples_per_segment, list of per-channel bands)
+    """
+    with open_wav(audio_file) as fid, profiling.stage("stream_decode_fft") as counts:
+        header = read_wav_header(fid)
+        rate = header["rate"]
+        beat_duration, samples_per_segment = segment_length(rate, bpm, beat_division)
+        if block_segments is None:
+            block_segments = max(1, FFT_BLOCK_SAMPLES // samples_per_segment)
+
+        channel_blocks = [[] for _ in range(header["channels"])]
+        for i, data in enumerate(iter_wav_blocks(fid, header, block_segments * samples_per_segment)):
+            if i == 0:
+                is_valid, warnings = validate_wav_format(rate, data, bit_depth=header["bit_depth"])
+            data = data.reshape(len(data), -1)
+            for blocks, bands in zip(channel_blocks, channel_band_energies(data, samples_per_segment, rate, workers)):
+                blocks.append(bands)
+        counts["segments"] = sum(len(bands) for bands in channel_blocks[0])
+
+    bands = [np.concatenate(blocks) if blocks else np.empty((0, len(BASS_BANDS))) for blocks in channel_blocks]
+    return rate, beat_duration, samples_per_segment, bands
+
+def calculate_channel_band_energies(audio_file, bpm=160, beat_division=4, stream=False, cache=None, workers=None):
+    """
+    calculate_band_energies without the downmix: every channel gets its own band
+    energies, computed in parallel threads.
+
+    Returns:
+        tuple: (rate, beat_duration, samples_per_segment, list of per-channel bands)
+    """
+    if cache is not None and not hasattr(audio_file, "read"):
+        with profiling.stage("cache_lookup") as counts:
+            key = cache.key(audio_file, bpm=bpm, beat_division=beat_division, per_channel=True)
+            cached = cache.get(key)
+            counts["hit"] = int(cached is not None)
+        if cached is not None:
+            rate, beat_duration, samples_per_segment, bands = cached
+            return rate, beat_duration, samples_per_segment, list(bands)
+        result = calculate_channel_band_energies(audio_file, bpm=bpm, beat_division=beat_division,
+                                                 stream=stream, workers=workers)
+        with profiling.stage("cache_store"):
+            # Channels are stored stacked as one (channels, segments, bands) array
+            cache.put(key, *result[:3], np.stack(result[3]))
+        return result
+
+    if stream:
+        return stream_channel_band_energies(audio_file, bpm=bpm, beat_division=beat_division, workers=workers)
+
+    rate, data = load_channels(audio_file)
+    beat_duration, samples_per_segment = segment_length(rate, bpm, beat_division)
+    bands = channel_band_energies(data, samples_per_segment, rate, workers)
+    return rate, beat_duration, samples_per_segment, bands
+
+def calculate_bass_thresholds(audio_file, bpm=160, beat_division=4, stream=False, cache=None, target_rate=None,
+                              engine='fft'):
+    """
+    Analyzes audio file for bass energy with focus on transients
+
+    Args:
+        stream: Read and analyze the file in constant-memory blocks instead of loading it whole
+        cache: Optional AnalysisCache for the per-segment band energies
+        target_rate: Decimate to about this sample rate before the FFTs
+        engine: Band energy engine, 'fft' or 'iir'
+    """
+    rate, beat_duration, samples_per_segment, bands = calculate_band_energies(
+        audio_file, bpm=bpm, beat_division=beat_division, stream=stream, cache=cache, target_rate=target_rate,
+        engine=engine
+    )
+    bass_energies, transient_energies = energies_from_bands(bands)
+    timestamps = segment_timestamps(len(bands), samples_per_segment, rate, beat_duration)
+
+    bass_thresholds = calculate_thresholds(bass_energies)
+    transient_thresholds = calculate_thresholds(transient_energies)
+
     return bass_thresholds, bass_energies, transient_energies, timestamps
 
 def convolve(bass_energies, window_size=5):
@@ -121,20 +707,95 @@ def auto_correlate(bass_energies, max_lag=None):
     """
     Autocorrelation to find repeating patterns in the bass energy
     Useful for detecting rhythm patterns and periodicity
+    Computed with zero-padded FFTs in O(n log n)
     """
+    n = len(bass_energies)
     if max_lag is None:
-        max_lag = len(bass_energies) // 2
-        
-    result = np.zeros(max_lag)
+        max_lag = n // 2
+
     mean = np.mean(bass_energies)
     var = np.var(bass_energies)
-    
-    for lag in range(max_lag):
-        cov = np.mean((bass_energies[:(len(bass_energies)-lag)] - mean) * 
-                      (bass_energies[lag:] - mean))
-        result[lag] = cov / var if var > 0 else 0
-        
-    return result
+    if var == 0:
+        return np.zeros(max_lag)
+
+    # Pad to at least 2n so the circular correlation doesn't wrap around
+    n_fft = 1 << (2 * n - 1).bit_length()
+    spectrum = np.fft.rfft(np.asarray(bass_energies) - mean, n_fft)
+    lagged_sums = np.fft.irfft(spectrum * np.conj(spectrum), n_fft)[:max_lag]
+
+    # Mean over the n - lag overlapping samples, as covariance
+    cov = lagged_sums / (n - np.arange(max_lag))
+    return cov / var
+
+def estimate_bpm(wav_path, min_bpm=60, max_bpm=200, stream=False, cache=None, target_rate=None, engine='fft'):
+    """
+    Estimates tempo from the autocorrelation of a bass onset envelope
+
+    Args:
+        wav_path: Path to the WAV file
+        min_bpm: Slowest tempo considered
+        max_bpm: Fastest tempo considered
+
+    Returns:
+        tuple: (bpm, confidence) where confidence is the 0-1 autocorrelation
+               strength of the detected beat period
+    """
+    # 60 bpm split 50 ways gives fixed 20 ms frames, fine enough for onsets while
+    # keeping 50 Hz bins so every bass band has some bins
+    rate, _, samples_per_segment, bands = calculate_band_energies(
+        wav_path, bpm=60, beat_division=ONSET_DIVISION, stream=stream, cache=cache, target_rate=target_rate,
+        engine=engine
+    )
+    frame_seconds = samples_per_segment / rate
+    bass_energies, _ = energies_from_bands(bands)
+    # Half-wave rectified energy rise marks the onsets
+    onsets = np.maximum(0, np.diff(bass_energies))
+    # Widen single-frame onset spikes so periods between two lags still correlate
+    onsets = convolve(onsets, window_size=3)
+
+    max_lag = min(len(onsets) - 1, int(np.ceil(60 / (min_bpm * frame_seconds))) * BPM_HARMONICS + 2)
+    if max_lag < 3:
+        raise ValueError("Audio is too short to estimate BPM")
+    auto_corr = auto_correlate(onsets, max_lag=max_lag)
+
+    def refine_peak(lag):
+        # Parabolic interpolation around an integer lag
+        if lag <= 0 or lag >= len(auto_corr) - 1:
+            return float(lag)
+        left, center, right = auto_corr[lag - 1:lag + 2]
+        denominator = left - 2 * center + right
+        return lag + (0.5 * (left - right) / denominator if denominator else 0.0)
+
+    lowest_lag = max(1, int(np.floor(60 / (max_bpm * frame_seconds))))
+    highest_lag = min(len(auto_corr) - 2, int(np.ceil(60 / (min_bpm * frame_seconds))))
+    if highest_lag <= lowest_lag:
+        raise ValueError("Audio is too short to estimate BPM")
+    lag = lowest_lag + int(np.argmax(auto_corr[lowest_lag:highest_lag + 1]))
+    # A bar-level period correlates about as well as the beat, prefer the faster tempo
+    while lag // 2 - 1 >= lowest_lag:
+        half = lag // 2 - 1 + int(np.argmax(auto_corr[lag // 2 - 1:lag // 2 + 2]))
+        if auto_corr[half] < OCTAVE_RATIO * auto_corr[lag]:
+            break
+        lag = half
+    confidence = float(np.clip(auto_corr[lag], 0, 1))
+
+    # Refine the period using its multiples, which are measured in more frames
+    periods, weights = [refine_peak(lag)], [1]
+    for harmonic in range(2, BPM_HARMONICS + 1):
+        center = int(round(periods[0] * harmonic))
+        if center + 1 >= len(auto_corr):
+            break
+        window = auto_corr[center - 1:center + 2]
+        peak = center - 1 + int(np.argmax(window))
+        periods.append(refine_peak(peak))
+        weights.append(harmonic)
+    # Ratio estimate sum(peak_k) / sum(k) of peak_k = k * period, the weighted least squares fit
+    # when a peak's error variance grows with k (plain least squares, sum(k * peak_k) / sum(k^2),
+    # leans harder on the far harmonics and came out about twice as far off on the test tracks)
+    period = sum(periods) / sum(weights)
+
+    bpm = 60 / (period * frame_seconds)
+    return round(float(bpm), 2), confidence
 
 def normalize_to_float(val: np.ndarray, min_val: np.float64, max_val: np.float64) -> np.ndarray:
     clipped_val = np.clip(val, min_val, max_val)
@@ -143,49 +804,45 @@ def normalize_to_float(val: np.ndarray, min_val: np.float64, max_val: np.float64
 def interpolate_array(array: np.ndarray) -> np.ndarray:
     return np.interp(array, (array.min(), array.max()), (0, 1))
 
-def generate_bass_data(wav_path, bpm=160, beat_division=4, smoothing_window=3, 
-                      threshold_vals=('low', 'high'), smoothing_algo='convolution',
-                      transient_focus=0.7):  # New parameter for balancing transients vs sustained bass
+def bass_data_from_bands(bands, rate, beat_duration, samples_per_segment, beat_division=4,
+                         smoothing_window=3, threshold_vals=('low', 'high'),
+                         smoothing_algo='convolution', transient_focus=0.7, thresholds=None):
     """
-    Generates bass analysis data with emphasis on transients/punch
-    
-    Args:
-        wav_path: Path to the WAV file
-        bpm: Beats per minute
-        beat_division: Number of segments per beat
-        smoothing_window: Window size for smoothing algorithm
-        threshold_vals: Tuple of (lower, upper) threshold keys
-        smoothing_algo: Algorithm for smoothing
-        transient_focus: 0.0-1.0 value where higher values emphasize punchy transients
+    Post-processing half of generate_bass_data: turns per-segment band energies
+    into the smoothed, normalized segment data. Cheap compared to the analysis.
+    thresholds is a fixed calculate_thresholds dict (e.g. album-wide bounds) to
+    normalize with instead of this track's own.
     """
-    bass_thresholds, bass_energies, transient_energies, timestamps = calculate_bass_thresholds(
-        wav_path, bpm=bpm, beat_division=beat_division
-    )
-    
+    bass_energies, transient_energies = energies_from_bands(bands)
+    time_seconds, beat_numbers = segment_times(len(bands), samples_per_segment, rate, beat_duration)
+    with profiling.stage("thresholds", segments=len(bands)):
+        bass_thresholds = calculate_thresholds(bass_energies) if thresholds is None else thresholds
+
     # Combine bass energy and transients based on transient_focus parameter
     combined_energy = (1 - transient_focus) * bass_energies + transient_focus * transient_energies
     
     # Apply selected smoothing algorithm on the combined energy
-    match smoothing_algo:
-        case 'convolution':
-            smoothed_energies = convolve(combined_energy, window_size=smoothing_window)
-        case 'cross_correlation':
-            # Use first beat as pattern by default
-            pattern_length = int(beat_division)
-            pattern = bass_energies[:pattern_length] if len(bass_energies) > pattern_length else bass_energies
-            smoothed_energies = cross_correlate(bass_energies, pattern)
-        case 'auto_correlation':
-            # Auto-correlation output length doesn't match input
-            # Use it for analysis but not for direct replacement
-            auto_corr = auto_correlate(bass_energies)
-            # Just use convolution for smoothing in this case
-            smoothed_energies = convolve(bass_energies, window_size=smoothing_window)
-            # Store autocorrelation separately
-            result_extra = {'autocorrelation': auto_corr.tolist()}
-        case 'none':
-            smoothed_energies = bass_energies.copy()
-        case _:
-            raise ValueError(f"Unknown smoothing algorithm: {smoothing_algo}")
+    with profiling.stage(f"smoothing_{smoothing_algo}", segments=len(bands)):
+        match smoothing_algo:
+            case 'convolution':
+                smoothed_energies = convolve(combined_energy, window_size=smoothing_window)
+            case 'cross_correlation':
+                # Use first beat as pattern by default
+                pattern_length = int(beat_division)
+                pattern = bass_energies[:pattern_length] if len(bass_energies) > pattern_length else bass_energies
+                smoothed_energies = cross_correlate(bass_energies, pattern)
+            case 'auto_correlation':
+                # Auto-correlation output length doesn't match input
+                # Use it for analysis but not for direct replacement
+                auto_corr = auto_correlate(bass_energies)
+                # Just use convolution for smoothing in this case
+                smoothed_energies = convolve(bass_energies, window_size=smoothing_window)
+                # Store autocorrelation separately
+                result_extra = {'autocorrelation': auto_corr.tolist()}
+            case 'none':
+                smoothed_energies = bass_energies.copy()
+            case _:
+                raise ValueError(f"Unknown smoothing algorithm: {smoothing_algo}")
     
     # Normalize between selected thresholds
     lower_bound, upper_bound = threshold_vals
@@ -194,28 +851,280 @@ def generate_bass_data(wav_path, bpm=160, beat_division=4, smoothing_window=3,
     )
     
     # Combine everything into a clean data structure
+    # beats/normalized_values keep the arrays for bulk consumers like BeatSchema.add_shift_events
     result = {
         'thresholds': bass_thresholds,
+        'beats': beat_numbers,
+        'normalized_values': normalized_values,
         'segments': []
     }
     
-    for i, timestamp in enumerate(timestamps):
-        result['segments'].append({
-            'time_seconds': timestamp['time_seconds'],
-            'beat': timestamp['beat'],
-            'beat_fraction': timestamp['beat_fraction'],
-            'raw_energy': float(bass_energies[i]),
-            'smoothed_energy': float(smoothed_energies[i]),
-            'normalized_value': float(normalized_values[i])
-        })
+    with profiling.stage("segment_dicts", segments=len(bands)):
+        for i, (timestamp_seconds, beat_number) in enumerate(zip(time_seconds.tolist(), beat_numbers.tolist())):
+            result['segments'].append({
+                'time_seconds': timestamp_seconds,
+                'beat': beat_number,
+                'beat_fraction': beat_number % 1,
+                'raw_energy': float(bass_energies[i]),
+                'smoothed_energy': float(smoothed_energies[i]),
+                'normalized_value': float(normalized_values[i])
+            })
     
     return result
 
+def moving_averages(signals, windows):
+    """
+    convolve() of every row of a 2-D signals array with every window at once, from
+    one cumulative sum per row. Returns shape (rows, len(windows), samples).
+    """
+    n = signals.shape[1]
+    cumulative = np.zeros((len(signals), n + 1))
+    np.cumsum(signals, axis=1, out=cumulative[:, 1:])
+    windows = np.asarray(windows)[:, None]
+    # np.convolve(mode='same') with a ones(w) kernel sums x[i - w//2 .. i + (w-1)//2]
+    positions = np.arange(n)
+    lower = np.clip(positions - windows // 2, 0, n)
+    upper = np.clip(positions + (windows - 1) // 2 + 1, 0, n)
+    return (cumulative[:, upper] - cumulative[:, lower]) / windows
+
+def sweep_bass_data(bands, rate, beat_duration, samples_per_segment, beat_division=4,
+                    transient_focus=(0.7,), smoothing_algos=('convolution',), smoothing_windows=(3,),
+                    threshold_vals=(('low', 'high'),), thresholds=None):
+    """
+    Every combination of the bass_data_from_bands post-processing parameters over one
+    band energy analysis. Smoothing is linear, so the bass and transient curves are
+    smoothed once per window and the transient_focus mixes and the bounds are
+    broadcast over them. Like bass_data_from_bands, the algorithms other than
+    convolution smooth the bass energy alone and ignore transient_focus, and 'none'
+    and cross_correlation ignore the window too.
+
+    Returns:
+        dict: thresholds, beats, combinations (one dict of smoothing_algo,
+              smoothing_window, transient_focus and threshold_vals per row, ordered
+              by algorithm, then window, focus and bounds) and normalized_values,
+              an array of shape (len(combinations), segments)
+    """
+    for algo in smoothing_algos:
+        if algo not in SMOOTHING_ALGOS:
+            raise ValueError(f"Unknown smoothing algorithm: {algo}")
+    bass_energies, transient_energies = energies_from_bands(bands)
+    _, beat_numbers = segment_times(len(bands), samples_per_segment, rate, beat_duration)
+    with profiling.stage("thresholds", segments=len(bands)):
+        bass_thresholds = calculate_thresholds(bass_energies) if thresholds is None else thresholds
+
+    focus = np.asarray(transient_focus, dtype=np.float64)
+    windows = np.asarray(smoothing_windows)
+    lower = np.array([bass_thresholds[low] for low, _ in threshold_vals])
+    upper = np.array([bass_thresholds[high] for _, high in threshold_vals])
+    n_windows, n_focus, n_bounds = len(windows), len(focus), len(threshold_vals)
+
+    normalized = []
+    with profiling.stage("sweep", segments=len(bands), combinations=len(smoothing_algos) * n_windows * n_focus * n_bounds):
+        smoothed_bass, smoothed_transients = moving_averages(np.stack([bass_energies, transient_energies]), windows)
+        for algo in smoothing_algos:
+            # smoothed: (windows, focus, segments)
+            if algo == 'convolution':
+                smoothed = smoothed_bass[:, None] + focus[:, None] * (smoothed_transients - smoothed_bass)[:, None]
+            elif algo == 'auto_correlation':
+                smoothed = smoothed_bass[:, None]
+            elif algo == 'cross_correlation':
+                pattern_length = int(beat_division)
+                pattern = bass_energies[:pattern_length] if len(bass_energies) > pattern_length else bass_energies
+                smoothed = cross_correlate(bass_energies, pattern)[None, None]
+            else:
+                smoothed = bass_energies[None, None]
+            smoothed = np.broadcast_to(smoothed, (n_windows, n_focus, len(bands)))
+            # (windows, focus, bounds, segments), as normalize_to_float
+            clipped = np.clip(smoothed[:, :, None], lower[:, None], upper[:, None])
+            normalized.append(((clipped - lower[:, None]) / (upper - lower)[:, None]).reshape(-1, len(bands)))
+
+    combinations = [
+        {'smoothing_algo': algo, 'smoothing_window': int(window), 'transient_focus': float(f), 'threshold_vals': tuple(bounds)}
+        for algo in smoothing_algos for window in windows for f in focus for bounds in threshold_vals
+    ]
+    return {
+        'thresholds': bass_thresholds,
+        'beats': beat_numbers,
+        'combinations': combinations,
+        'normalized_values': np.concatenate(normalized) if normalized else np.empty((0, len(bands))),
+    }
+
+def generate_bass_data(wav_path, bpm=160, beat_division=4, smoothing_window=3, 
+                      threshold_vals=('low', 'high'), smoothing_algo='convolution',
+                      transient_focus=0.7,  # New parameter for balancing transients vs sustained bass
+                      stream=False, cache=None, target_rate=None, engine='fft', thresholds=None):
+    """
+    Generates bass analysis data with emphasis on transients/punch
+    
+    Args:
+        wav_path: Path to the WAV file
+        bpm: Beats per minute
+        beat_division: Number of segments per beat
+        smoothing_window: Window size for smoothing algorithm
+        threshold_vals: Tuple of (lower, upper) threshold keys
+        smoothing_algo: Algorithm for smoothing
+        transient_focus: 0.0-1.0 value where higher values emphasize punchy transients
+        stream: Analyze the file in constant-memory blocks instead of loading it whole
+        cache: Optional AnalysisCache; reruns with the same bpm/beat_division skip decoding and FFT
+        target_rate: Decimate to about this sample rate (e.g. 2000) before the FFTs, much less
+                     work for band energies within a percent or so of full rate (see validate_decimation)
+        engine: 'fft' (per-segment FFTs) or 'iir' (continuous band-pass filter bank, see BassFilterBank)
+        thresholds: Fixed thresholds dict, e.g. album-wide ones from a merged bass_energy_sketch
+    """
+    rate, beat_duration, samples_per_segment, bands = calculate_band_energies(
+        wav_path, bpm=bpm, beat_division=beat_division, stream=stream, cache=cache, target_rate=target_rate,
+        engine=engine
+    )
+    return bass_data_from_bands(
+        bands, rate, beat_duration, samples_per_segment,
+        beat_division=beat_division, smoothing_window=smoothing_window,
+        threshold_vals=threshold_vals, smoothing_algo=smoothing_algo,
+        transient_focus=transient_focus, thresholds=thresholds
+    )
+
+def sample_full_scale(wav_path):
+    """Full-scale sample magnitude of a WAV file's format, from its header (see wav_stream.full_scale)"""
+    with open_wav(wav_path) as fid:
+        return full_scale(read_wav_header(fid)["dtype"])
+
+def bass_energy_sketch(wav_path, bpm=160, beat_division=4, stream=False, cache=None, target_rate=None,
+                       engine='fft', exact=False, relative=False):
+    """
+    QuantileSketch of a track's bass energies. Sketches of several tracks merge into
+    consistent album-wide thresholds without keeping their energy arrays around.
+    Energies are in sample units, so with tracks of different sample formats
+    (16-bit, 24-bit, float) sketch them relative to full scale and scale the
+    shared thresholds back for each track:
+
+        sketches = [bass_energy_sketch(path, bpm, relative=True) for path in album]
+        thresholds = calculate_thresholds(QuantileSketch.merged(sketches))
+        generate_bass_data(path, bpm, thresholds=scale_thresholds(thresholds, sample_full_scale(path)))
+    """
+    _, _, _, bands = calculate_band_energies(
+        wav_path, bpm=bpm, beat_division=beat_division, stream=stream, cache=cache, target_rate=target_rate,
+        engine=engine
+    )
+    bass_energies = energies_from_bands(bands)[0]
+    if relative:
+        bass_energies = bass_energies / sample_full_scale(wav_path)
+    return threshold_sketch(bass_energies, exact=exact)
+
+def scale_thresholds(thresholds, scale):
+    """Thresholds multiplied by scale, e.g. full-scale relative ones back into a track's sample units"""
+    return {key: value * scale for key, value in thresholds.items()}
+
+def aggregate_bands(bands, samples_per_segment, coarse_samples_per_segment):
+    """
+    Sums fine segment band energies into a coarser grid whose segments are a whole
+    number of fine segments. Only lossless for additive energies, i.e. filter bank
+    powers; FFT band magnitudes of short frames don't add up to a longer frame's
+    (short frames lose bins and the bias differs per band and segment).
+    """
+    ratio, remainder = divmod(coarse_samples_per_segment, samples_per_segment)
+    if remainder:
+        raise ValueError(f"{coarse_samples_per_segment}-sample segments aren't a whole number of "
+                         f"{samples_per_segment}-sample segments")
+    # Approximate track length, good to within one fine segment
+    n_samples = len(bands) * samples_per_segment
+    n_coarse = n_samples // coarse_samples_per_segment
+    if n_samples % coarse_samples_per_segment >= coarse_samples_per_segment * 0.5:
+        n_coarse += 1
+    fine_starts = np.arange(n_coarse) * ratio
+    fine_starts = fine_starts[fine_starts < len(bands)]
+    if not len(fine_starts):
+        return np.empty((0, bands.shape[1]))
+    return np.add.reduceat(bands, fine_starts, axis=0)
+
+def generate_multi_division_data(wav_path, bpm=160, beat_divisions=(4, 8, 16, 32), exact=True,
+                                 stream=False, cache=None, target_rate=None, engine='fft', **kwargs):
+    """
+    Generates bass data for several beat divisions from a single decode, every
+    division with its own analysis pass, matching generate_bass_data exactly.
+
+    With exact=False and the iir engine, divisions whose segments are a whole number
+    of the finest division's segments are derived from its filter bank energies
+    instead: powers add up, so that is exact except for the trailing partial segment.
+    FFT energies are never derived, summing short-frame magnitudes isn't a usable
+    approximation of a longer frame.
+
+    Args:
+        beat_divisions: Divisions to produce results for
+        exact: Analyze every division, also where deriving it would be possible
+        stream, cache: Used for the finest division's analysis when deriving
+        target_rate: Decimate to about this sample rate before the analysis
+        engine: Band energy engine, 'fft' or 'iir'
+        **kwargs: Passed on to bass_data_from_bands (smoothing, thresholds, transient_focus)
+
+    Returns:
+        dict: beat_division -> result dict shaped like generate_bass_data output
+    """
+    fine = None
+    if not exact and engine == 'iir':
+        fine = calculate_band_energies(
+            wav_path, bpm=bpm, beat_division=max(beat_divisions), stream=stream, cache=cache,
+            target_rate=target_rate, engine=engine
+        )
+    data = None
+    results = {}
+    for division in beat_divisions:
+        if fine is not None:
+            rate, beat_duration, samples_per_segment, bands = fine
+            _, coarse_samples_per_segment = segment_length(rate, bpm, division)
+            if coarse_samples_per_segment % samples_per_segment == 0:
+                # sqrt(N/2 * power) energies: sum the powers, then rescale to the coarse length
+                division_bands = np.sqrt(aggregate_bands(bands ** 2, samples_per_segment, coarse_samples_per_segment)
+                                         * (coarse_samples_per_segment / samples_per_segment))
+                results[division] = bass_data_from_bands(
+                    division_bands, rate, beat_duration, coarse_samples_per_segment, beat_division=division, **kwargs
+                )
+                continue
+        if data is None:
+            rate, data = load_channels(wav_path) if target_rate or engine != 'fft' else load_mono(wav_path)
+        beat_duration, samples_per_segment = segment_length(rate, bpm, division)
+        bands = signal_band_energies(data, samples_per_segment, rate, engine, target_rate)
+        results[division] = bass_data_from_bands(
+            bands, rate, beat_duration, samples_per_segment, beat_division=division, **kwargs
+        )
+    return results
+
+def generate_lane_bass_data(wav_path, bpm=160, beat_division=4, stems=None, stream=False, cache=None,
+                            workers=None, **kwargs):
+    """
+    Generates bass data for several lanes analyzed independently instead of one mono mix.
+
+    Without stems every channel of wav_path is a lane, so hard-panned bass isn't
+    averaged away. With stems, wav_path and every stem file are analyzed (each
+    downmixed on its own) as lanes in that order. Either way the analyses run
+    in a thread pool.
+
+    Args:
+        stems: Extra stem files, one lane each after wav_path
+        workers: Thread count (default: one per lane, up to the CPU count)
+        **kwargs: Passed on to bass_data_from_bands (smoothing, thresholds, transient_focus)
+
+    Returns:
+        list: one result dict per lane, shaped like generate_bass_data output
+    """
+    if stems:
+        lanes = thread_map(
+            lambda path: calculate_band_energies(path, bpm=bpm, beat_division=beat_division, stream=stream, cache=cache),
+            [wav_path, *stems], workers)
+    else:
+        rate, beat_duration, samples_per_segment, channel_bands = calculate_channel_band_energies(
+            wav_path, bpm=bpm, beat_division=beat_division, stream=stream, cache=cache, workers=workers
+        )
+        lanes = [(rate, beat_duration, samples_per_segment, bands) for bands in channel_bands]
+
+    return [
+        bass_data_from_bands(bands, rate, beat_duration, samples_per_segment, beat_division=beat_division, **kwargs)
+        for rate, beat_duration, samples_per_segment, bands in lanes
+    ]
+
 if __name__ == "__main__":
-    # Example usage with different granularities
-    for division in [4, 8, 16, 32]:
+    # Example usage with different granularities, all from one decode
+    results = generate_multi_division_data(WAV_PATH, bpm=160, beat_divisions=[4, 8, 16, 32])
+    for division, result in results.items():
         print(f"\nAnalyzing with {division} segments per beat:")
-        result = generate_bass_data(WAV_PATH, bpm=160, beat_division=division)
         print(f"Generated {len(result['segments'])} segments")
         print(f"Thresholds: {result['thresholds']}")
         
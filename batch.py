@@ -0,0 +1,310 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from analysis_cache import AnalysisCache, DEFAULT_CACHE_DIR
+from profiling import aggregate, format_stages
+from constants import ANALYSIS_ENGINES, DEFAULT_DECIMATION_RATE
+from main import check_decimation_rate, parse_bpm, parse_min_max, process_track
+
+def load_manifest(manifest_path):
+    """
+    Reads a CSV or JSON manifest of tracks. Each entry has a path and optionally
+    bpm, division and bounds (e.g. "low,high"). Relative paths are resolved
+    against the manifest's directory.
+    """
+    manifest_path = Path(manifest_path)
+    if manifest_path.suffix.lower() == ".json":
+        with open(manifest_path) as f:
+            entries = json.load(f)
+    else:
+        with open(manifest_path, newline="") as f:
+            entries = [
+                {key: value for key, value in row.items() if value not in (None, "")}
+                for row in csv.DictReader(f)
+            ]
+
+    jobs = []
+    for entry in entries:
+        path = Path(entry["path"])
+        if not path.is_absolute():
+            path = manifest_path.parent / path
+        job = {"path": str(path)}
+        if "bpm" in entry:
+            job["bpm"] = parse_bpm(str(entry["bpm"]))
+        if "division" in entry:
+            job["beat_division"] = int(entry["division"])
+        if "bounds" in entry:
+            job["min_max"] = entry["bounds"]
+        jobs.append(job)
+    return jobs
+
+def collect_jobs(source):
+    """Turns a directory, a glob pattern or a manifest file into a list of job dicts"""
+    if os.path.isdir(source):
+        paths = sorted(str(p) for p in Path(source).iterdir() if p.suffix.lower() == ".wav")
+    elif os.path.isfile(source) and Path(source).suffix.lower() in (".csv", ".json"):
+        return load_manifest(source)
+    else:
+        paths = sorted(glob.glob(source, recursive=True))
+    return [{"path": path} for path in paths]
+
+def output_path(wav_path, output_dir, as_leveldata):
+    stem = Path(wav_path).stem
+    return str(Path(output_dir) / (f"{stem}.LevelData" if as_leveldata else f"{stem}.json"))
+
+def assign_outputs(jobs, output_dir, as_leveldata):
+    """
+    Sets every job's output file, named by the track's stem. When tracks share a
+    stem (e.g. 01.wav in several pack folders) their directories relative to the
+    common parent of all tracks are mirrored under output_dir instead. Returns the
+    output paths still shared by several jobs, e.g. a track listed twice.
+    """
+    outputs = [output_path(job["path"], output_dir, as_leveldata) for job in jobs]
+    if len(set(outputs)) < len(outputs):
+        directories = [os.path.dirname(os.path.abspath(job["path"])) for job in jobs]
+        root = os.path.commonpath(directories)
+        outputs = [
+            output_path(job["path"], Path(output_dir) / os.path.relpath(directory, root), as_leveldata)
+            for job, directory in zip(jobs, directories)
+        ]
+    for job, output in zip(jobs, outputs):
+        job["output"] = output
+    seen, shared = set(), set()
+    for output in outputs:
+        (shared if output in seen else seen).add(output)
+    return sorted(shared)
+
+def run_job(job):
+    """
+    Worker entry point. Never raises: failures are reported in the returned dict
+    so one bad file can't abort the batch.
+    """
+    start = time.perf_counter()
+    result = {"path": job["path"], "output": job["output"]}
+    try:
+        result.update(process_track(
+            job["path"],
+            job["bpm"],
+            job["output"],
+            beat_division=job["beat_division"],
+            smoothing_window=job["smoothing_window"],
+            min_max=job["min_max"],
+            rounding=job["rounding"],
+            as_leveldata=job["as_leveldata"],
+            stream=job["stream"],
+            cache=job["cache"],
+            profile=job["profile"],
+            per_channel=job["per_channel"],
+            target_rate=job["target_rate"],
+            engine=job["engine"],
+            thresholds=job.get("thresholds"),
+            simplify=job["simplify"]))
+        if job.get("bpm_confidence") is not None:
+            # The BPM was estimated in the album thresholds pass
+            result["bpm_confidence"] = job["bpm_confidence"]
+        result["status"] = "ok"
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def run_sketch_job(job):
+    """
+    Worker entry point of the --album-thresholds pass: the track's bass energy
+    sketch, and its BPM if that has to be estimated. Never raises either.
+    """
+    from bass_bouncer import bass_energy_sketch, estimate_bpm, sample_full_scale
+
+    result = {"path": job["path"]}
+    options = dict(stream=job["stream"], cache=job["cache"], target_rate=job["target_rate"], engine=job["engine"])
+    try:
+        bpm = job["bpm"]
+        if bpm == "auto":
+            bpm, result["bpm_confidence"] = estimate_bpm(job["path"], **options)
+        result["bpm"] = bpm
+        result["sketch"] = bass_energy_sketch(job["path"], bpm, job["beat_division"], exact=job["exact"],
+                                              relative=True, **options)
+        result["full_scale"] = sample_full_scale(job["path"])
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+def iter_batch(jobs, workers=None, function=run_job):
+    """Runs function over jobs in a pool of worker processes, yielding results in job order as they finish"""
+    if workers == 1:
+        yield from map(function, jobs)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(function, jobs)
+
+def run_batch(jobs, workers=None):
+    """Runs jobs across a pool of worker processes, returning results in job order"""
+    return list(iter_batch(jobs, workers))
+
+def album_thresholds(jobs, workers=None, exact=False):
+    """
+    First pass of --album-thresholds: sketches every track's bass energies and
+    merges them as they come in, so only one sketch is held at a time. Energies
+    are sketched relative to full scale, so tracks of different sample formats
+    share meaningful bounds. Fills in estimated BPMs and the bounds scaled to each
+    track's sample format on the jobs, and returns the shared bounds relative to
+    full scale.
+    """
+    from bass_bouncer import calculate_thresholds, scale_thresholds
+    from quantile_sketch import QuantileSketch
+
+    album = QuantileSketch(exact=exact)
+    # With exact the per-track sketches keep every value too
+    sketch_jobs = [dict(job, exact=exact) for job in jobs]
+    sketched = []
+    for job, result in zip(jobs, iter_batch(sketch_jobs, workers, run_sketch_job)):
+        if "error" in result:
+            # Left out of the bounds; the main pass reports the failure
+            continue
+        job["bpm"] = result["bpm"]
+        job["bpm_confidence"] = result.get("bpm_confidence")
+        album.merge(result["sketch"])
+        sketched.append((job, result["full_scale"]))
+    if not album.count:
+        return None
+    thresholds = {key: float(value) for key, value in calculate_thresholds(album).items()}
+    for job, full_scale in sketched:
+        job["thresholds"] = scale_thresholds(thresholds, full_scale)
+    return thresholds
+
+def preflight(jobs, workers=None):
+    """
+    Header-only check of every track before any analysis. Returns the jobs that
+    can be analyzed, and "rejected" results for the rest keyed by their position in jobs.
+    """
+    from wav_validator import scan_library
+
+    accepted, rejected = [], {}
+    for i, (job, report) in enumerate(zip(jobs, scan_library([job["path"] for job in jobs], workers))):
+        if report["ok"]:
+            accepted.append(job)
+        else:
+            rejected[i] = {"path": job["path"], "output": job["output"], "status": "rejected",
+                           "error": "; ".join(report["errors"]), "seconds": 0.0}
+    return accepted, rejected
+
+def print_summary(results, elapsed):
+    for result in results:
+        if result["status"] != "ok":
+            detail = result["error"]
+        elif result["bpm_confidence"] is not None:
+            detail = f"{result['events']} events, estimated {result['bpm']} bpm, confidence {result['bpm_confidence']:.2f}"
+        else:
+            detail = f"{result['events']} events"
+        print(f"{result['status']:>8}  {result['seconds']:8.2f}s  {result['path']}  ({detail})")
+    failed = sum(result["status"] != "ok" for result in results)
+    rejected = sum(result["status"] == "rejected" for result in results)
+    print(f"{len(results) - failed}/{len(results)} tracks succeeded, {failed} failed"
+          + (f" ({rejected} rejected by --preflight)" if rejected else "") + f", {elapsed:.2f}s total")
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze many tracks in a pool of worker processes")
+    parser.add_argument("source", type=str, help="Directory of WAV files, glob pattern, or CSV/JSON manifest (path, bpm, division, bounds)")
+    parser.add_argument("--bpm", type=parse_bpm, default=None, help="BPM, or 'auto' to estimate it, for tracks the manifest doesn't give one for")
+    parser.add_argument("--beat_division", type=int, default=4, help="Number of segments per beat (default: 4)")
+    parser.add_argument("--smoothing_window", type=int, default=5, help="Window size for smoothing algorithm (default: 5)")
+    parser.add_argument("--min-max", type=str, default="min,max", help="Default bounds (default: min,max). Valid values: min, low, mid, high, max")
+    parser.add_argument("--no-round", action="store_false", default=True, help="Disable rounding of minmaxed values (default: True)")
+    parser.add_argument("--as-leveldata", action="store_true", default=False, help="Output as LevelData (default: False)")
+    parser.add_argument("--stream", action="store_true", default=False, help="Read WAVs in blocks to keep memory constant (default: False)")
+    parser.add_argument("--cache", nargs="?", const=str(DEFAULT_CACHE_DIR), default=None, help=f"Cache band energies on disk so reruns skip decoding and FFT (default dir: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--cache-size", type=int, default=512, help="Maximum cache size in MB before least recently used entries are evicted (default: 512)")
+    parser.add_argument("--per-channel", action="store_true", default=False, help="Analyze every channel separately, one output lane (file) each")
+    parser.add_argument("--decimate", nargs="?", type=int, const=DEFAULT_DECIMATION_RATE, default=None, metavar="RATE", help=f"Low-pass and decimate to about RATE Hz before the FFTs (default rate: {DEFAULT_DECIMATION_RATE})")
+    parser.add_argument("--engine", choices=ANALYSIS_ENGINES, default="fft", help="Band energy engine: per-segment FFTs or a continuous band-pass filter bank (default: fft)")
+    parser.add_argument("--simplify", type=float, default=None, metavar="TOLERANCE", help="Drop shift events whose value interpolating between their neighbours reproduces within TOLERANCE (e.g. 0.05)")
+    parser.add_argument("--album-thresholds", action="store_true", default=False, help="Normalize every track against bounds shared by the whole batch instead of its own (analyzes twice, use --cache)")
+    parser.add_argument("--exact-thresholds", action="store_true", default=False, help="Compute --album-thresholds from every energy value instead of a merged sketch")
+    parser.add_argument("--preflight", action="store_true", default=False, help="Check every WAV header first and reject broken files (truncated, unsupported, empty) without analyzing them")
+    parser.add_argument("--output-dir", type=str, default="output", help="Directory for per-track output files (default: output)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--summary", type=str, default=None, help="Also write the per-file summary as JSON to this path")
+    parser.add_argument("--profile", action="store_true", default=False, help="Profile every track's stages, print totals and add per-track profiles to the --summary JSON")
+    args = parser.parse_args()
+
+    try:
+        check_decimation_rate(args.decimate)
+    except ValueError as e:
+        parser.error(str(e))
+    if (args.decimate is not None or args.engine != "fft" or args.album_thresholds) and args.per_channel:
+        parser.error("--decimate, --engine iir and --album-thresholds can't be combined with --per-channel")
+
+    jobs = collect_jobs(args.source)
+    if not jobs:
+        parser.error(f"No tracks found for {args.source!r}")
+
+    cache = AnalysisCache(args.cache, args.cache_size * 1024 * 1024) if args.cache else None
+    for job in jobs:
+        job.setdefault("bpm", args.bpm)
+        job.setdefault("beat_division", args.beat_division)
+        job.setdefault("min_max", args.min_max)
+        job.update(
+            smoothing_window=args.smoothing_window,
+            rounding=args.no_round,
+            as_leveldata=args.as_leveldata,
+            stream=args.stream,
+            cache=cache,
+            profile=args.profile,
+            per_channel=args.per_channel,
+            target_rate=args.decimate,
+            engine=args.engine,
+            simplify=args.simplify,
+        )
+        if job["bpm"] is None:
+            parser.error(f"No bpm for {job['path']}, pass --bpm or add it to the manifest")
+        try:
+            parse_min_max(job["min_max"])
+        except ValueError as e:
+            parser.error(f"{job['path']}: {e}")
+
+    shared = assign_outputs(jobs, args.output_dir, args.as_leveldata)
+    if shared:
+        parser.error(f"Several tracks would be written to {', '.join(shared)}")
+    for directory in {os.path.dirname(job["output"]) for job in jobs}:
+        os.makedirs(directory, exist_ok=True)
+
+    start = time.perf_counter()
+    n_tracks, rejected = len(jobs), {}
+    if args.preflight:
+        jobs, rejected = preflight(jobs)
+        if rejected:
+            print(f"Preflight rejected {len(rejected)} of {n_tracks} tracks")
+    thresholds = None
+    if args.album_thresholds and jobs:
+        thresholds = album_thresholds(jobs, workers=args.workers, exact=args.exact_thresholds)
+        if thresholds is not None:
+            print("Album thresholds (of full scale): "
+                  + ", ".join(f"{key} {value:.4g}" for key, value in thresholds.items()))
+    analyzed = iter(run_batch(jobs, workers=args.workers) if jobs else [])
+    results = [rejected[i] if i in rejected else next(analyzed) for i in range(n_tracks)]
+    elapsed = time.perf_counter() - start
+    print_summary(results, elapsed)
+    summary = {"elapsed_seconds": elapsed, "results": results}
+    if thresholds is not None:
+        summary["album_thresholds"] = thresholds
+    if args.profile:
+        summary["profile"] = aggregate(result["profile"] for result in results if "profile" in result)
+        print("\nStage totals over all tracks:")
+        print(format_stages(summary["profile"]))
+
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(summary, f, indent=4)
+
+    sys.exit(1 if any(result["status"] != "ok" for result in results) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,35 @@
 import json
-import copy
 import datetime
+import itertools
+import os
+import time
+import tracemalloc
 from typing import Optional
-import sklearn as sk
-from collections import deque
+import numpy as np
 import gzip
+import profiling
+
+try:
+    import orjson  # optional, much faster JSON encoding
+except ImportError:
+    orjson = None
+
+DEFAULT_COMPRESSLEVEL = 6
+WRITE_BATCH_ENTITIES = 4096
 
 class BeatSchema:
-    def __init__(self, bpm: int, rounding=1):
+    def __init__(self, bpm: int, rounding=1, lane=0):
 
         self.ease = -1
         self.rounding = rounding
         self.bpm = bpm
+        self.lane = lane
 
         self.json_header = {
-            "lane":0,
+            "lane":lane,
             "beat":0,
             "entities": []
-        } # lane zero beat zero to make sure we always start from the beginning
+        } # beat zero to make sure we always start from the beginning, lane zero unless this is one lane of several
 
         self.leveldata_header = {
             "bgmOffset":0,
@@ -57,10 +69,13 @@ class BeatSchema:
                 "value":int # -1 = ease out, 0 = linear, 1 = ease in
                 }
             ]
-        }
+        } # for reference, entities are only built from the arrays below on export
 
-        self.entities_index = 0 # keep track of where you are
-        self.entities_list = [] # to write directly into the header i guess
+        # Shift events live in parallel arrays, one element per event
+        self._beats = np.empty(0)
+        self._values = np.empty(0)
+        self._eases = np.empty(0, dtype=np.int8)
+        self._pending = [] # single add_shift_event calls, merged into the arrays on first read
 
     @property
     def ease(self):
@@ -72,140 +87,365 @@ class BeatSchema:
             raise ValueError("ease must be between -1 and 1")
         self._ease = value
 
+    def _flush(self):
+        if self._pending:
+            beats, values, eases = zip(*self._pending)
+            self._beats = np.concatenate([self._beats, beats])
+            self._values = np.concatenate([self._values, values])
+            self._eases = np.concatenate([self._eases, np.array(eases, dtype=np.int8)])
+            self._pending = []
+
+    def _set_events(self, beats, values, eases):
+        self._pending = []
+        self._beats = np.asarray(beats, dtype=np.float64)
+        self._values = np.asarray(values, dtype=np.float64)
+        self._eases = np.asarray(eases, dtype=np.int8)
+
+    @property
+    def beats(self) -> np.ndarray:
+        self._flush()
+        return self._beats
+
+    @property
+    def values(self) -> np.ndarray:
+        self._flush()
+        return self._values
+
+    @property
+    def eases(self) -> np.ndarray:
+        self._flush()
+        return self._eases
+
+    @property
+    def entities_index(self) -> int:
+        return len(self._beats) + len(self._pending) # keep track of where you are
+
+    @property
+    def entities_list(self) -> list:
+        """Shift event entity dicts, built from the event arrays on access"""
+        return list(self.iter_shift_event_entities())
+
+    @entities_list.setter
+    def entities_list(self, entities: list):
+        self._set_events(
+            [entity["data"][0]["value"] for entity in entities],
+            [entity["data"][1]["value"] for entity in entities],
+            [entity["data"][2]["value"] for entity in entities],
+        )
+
+    def iter_shift_event_entities(self, with_references=False):
+        """
+        Lazily builds shift event entity dicts from the event arrays.
+        with_references adds the LevelData names and next references.
+        """
+        self._flush()
+        n_events = len(self._beats)
+        # Convert to Python scalars a chunk at a time to keep memory flat on big charts
+        for start in range(0, n_events, WRITE_BATCH_ENTITIES):
+            stop = start + WRITE_BATCH_ENTITIES
+            chunk = zip(self._beats[start:stop].tolist(), self._values[start:stop].tolist(), self._eases[start:stop].tolist())
+            for i, (beat, value, ease) in enumerate(chunk, start):
+                entity = self._shift_event_entity(beat, value, ease)
+                if with_references:
+                    if i < n_events - 1:
+                        # Add reference to the next entity
+                        entity["data"].append({"name": "next", "ref": hex(i + 2)})
+                    entity["name"] = hex(i + 1)
+                yield entity
+
+    @staticmethod
+    def _shift_event_entity(beat, value, ease):
+        return {
+            "archetype": "ShiftEvent",
+            "data": [
+                {"name": "#BEAT", "value": beat},
+                {"name": "value", "value": value},
+                {"name": "ease", "value": ease}
+            ]
+        }
+
+    def _round_values(self, values: np.ndarray) -> np.ndarray:
+        """
+        Vectorized equivalent of round(value, self.rounding) on Python floats.
+        np.round scales by 10**rounding first, which can land exactly on .5 for values
+        that aren't ties, so those few are settled by Python's correctly rounded round().
+        """
+        rounded = np.round(values, self.rounding)
+        scaled = values * 10.0 ** self.rounding
+        for i in np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-9):
+            rounded[i] = round(float(values[i]), self.rounding)
+        return rounded
+
     def add_shift_event(self, beat: float, value: float):
-        # deep copy to not reference same object constantly
-        new_shift_event = copy.deepcopy(self.shift_event)
+        self._pending.append((beat, round(value, self.rounding), self.ease))
 
-        new_shift_event["data"][0]["value"] = beat
-        new_shift_event["data"][1]["value"] = round(value, self.rounding)
-        new_shift_event["data"][2]["value"] = self.ease
-        
-        self.entities_list.append(new_shift_event)
-        self.entities_index += 1
+    def add_shift_events(self, beats, values, eases=None):
+        """
+        Bulk version of add_shift_event taking arrays, e.g. the 'beats' and
+        'normalized_values' of generate_bass_data output. eases defaults to self.ease.
+        """
+        with profiling.stage("schema_build", events=len(beats)):
+            beats = np.asarray(beats, dtype=np.float64)
+            values = self._round_values(np.asarray(values, dtype=np.float64))
+            if eases is None:
+                eases = np.full(len(beats), self.ease, dtype=np.int8)
+            self._flush()
+            self._set_events(
+                np.concatenate([self._beats, beats]),
+                np.concatenate([self._values, values]),
+                np.concatenate([self._eases, np.asarray(eases, dtype=np.int8)]),
+            )
 
     def validate_unique_shift_events(self):
         """
         Identifies redundant shift events while preserving the last event before a value change.
         This removes unnecessary events while maintaining proper transitions.
+        Returns the indices of the redundant events.
         """
-        if not self.entities_list:
-            return []  # No events to validate
-            
-        # Extract all shift events
-        shift_events = []
-        for event in self.entities_list:
-            if event["archetype"] == "ShiftEvent":
-                shift_events.append(event)
-        
-        if len(shift_events) <= 1:
-            return []  # Need at least 2 shift events to compare
-        
-        # Find redundant events but keep the last one before a change
-        redundant_events = []
-        
-        # Keep track of runs of identical values
-        current_value = shift_events[0]["data"][1]["value"]
-        current_run = [shift_events[0]]
-        
-        for i in range(1, len(shift_events)):
-            this_value = shift_events[i]["data"][1]["value"]
-            
-            if this_value == current_value:
-                # Add to the current run of identical values
-                current_run.append(shift_events[i])
-            else:
-                # Value changed - mark all but the last event in the run as redundant
-                if len(current_run) > 1:
-                    redundant_events.extend(current_run[:-1])
-                
-                # Start a new run
-                current_value = this_value
-                current_run = [shift_events[i]]
-        
-        # Handle the final run
-        if len(current_run) > 1:
-            redundant_events.extend(current_run[:-1])
-        
-        return redundant_events
+        values = self.values
+        # An event is redundant when the next one has the same value, i.e. it's
+        # part of a run of identical values but not the run's last event
+        return np.flatnonzero(values[:-1] == values[1:])
     
     def remove_redundant_shift_events(self):
         """
         Removes shift events that don't change the visual state (same value as previous).
         Returns the number of events removed.
         """
-        redundant_events = self.validate_unique_shift_events()
-        
-        # Remove redundant events
-        for event in redundant_events:
-            self.entities_list.remove(event)
-        
-        # Update the index
-        self.entities_index = len(self.entities_list)
-        
+        with profiling.stage("dedup", events=self.entities_index) as counts:
+            redundant_events = self.validate_unique_shift_events()
+
+            # Remove redundant events
+            self._set_events(
+                np.delete(self._beats, redundant_events),
+                np.delete(self._values, redundant_events),
+                np.delete(self._eases, redundant_events),
+            )
+            counts["removed"] = len(redundant_events)
+
         return len(redundant_events)
 
+    def simplify_shift_events(self, tolerance):
+        """
+        Drops shift events whose value the line between the kept neighbours reproduces
+        within tolerance, using swing door compression: one pass that narrows the cone
+        of slopes from the last kept event through every skipped one, O(n).
+        First and last events are always kept, and so are events sharing a beat (an
+        instant jump). Spans that lost events get a linear ease (0), so the editor
+        draws the line the tolerance was checked against. Beats must not decrease.
+
+        Returns:
+            dict: events before and after, events removed and the largest value error
+        """
+        if np.any(np.diff(self.beats) < 0):
+            raise ValueError("Shift event beats must be non-decreasing to simplify them")
+        with profiling.stage("simplify", events=self.entities_index) as counts:
+            beats, values = self.beats.tolist(), self.values.tolist()
+            n_events = len(beats)
+            keep = list(range(n_events))
+            if n_events > 2 and tolerance > 0:
+                keep = [0]
+                anchor_beat, anchor_value = beats[0], values[0]
+                low, high = -np.inf, np.inf  # slopes from the anchor passing within tolerance of the skipped events
+                for i in range(1, n_events):
+                    if beats[i] == beats[i - 1]:
+                        # No line can pass through both sides of a jump, keep both and start over from it
+                        if keep[-1] != i - 1:
+                            keep.append(i - 1)
+                        keep.append(i)
+                        anchor_beat, anchor_value = beats[i], values[i]
+                        low, high = -np.inf, np.inf
+                        continue
+                    span = beats[i] - anchor_beat
+                    slope = (values[i] - anchor_value) / span
+                    if not low <= slope <= high:
+                        # The line to i misses a skipped event, so the previous event ends the span
+                        keep.append(i - 1)
+                        anchor_beat, anchor_value = beats[i - 1], values[i - 1]
+                        span = beats[i] - anchor_beat
+                        low, high = -np.inf, np.inf
+                    low = max(low, (values[i] - tolerance - anchor_value) / span)
+                    high = min(high, (values[i] + tolerance - anchor_value) / span)
+                if keep[-1] != n_events - 1:
+                    keep.append(n_events - 1)
+
+            keep = np.asarray(keep, dtype=np.intp)
+            eases = self._eases[keep].copy()
+            eases[:-1][np.diff(keep) > 1] = 0
+            kept_beats, kept_values = self._beats[keep], self._values[keep]
+            # Only dropped events have an error; they never share a beat with a kept one
+            dropped = np.ones(n_events, dtype=bool)
+            dropped[keep] = False
+            error = np.abs(np.interp(self._beats[dropped], kept_beats, kept_values) - self._values[dropped])
+            self._set_events(kept_beats, kept_values, eases)
+            counts["removed"] = n_events - len(keep)
+
+        return {
+            "events_before": n_events,
+            "events_after": len(keep),
+            "removed": n_events - len(keep),
+            "max_error": float(error.max()) if len(error) else 0.0,
+        }
+
     def scale_minmax(self, rounding=True):
-        basevals = [entity["data"][1]["value"] for entity in self.entities_list.copy()]
-        scaled = sk.preprocessing.minmax_scale(basevals, feature_range=(0, 1))
-        for i, entity in enumerate(self.entities_list):
-            if rounding:
-                entity["data"][1]["value"] = round(scaled[i], self.rounding)
-            else:
-                entity["data"][1]["value"] = scaled[i]
+        """Min-max scales the event values to 0-1, same arithmetic as sklearn's minmax_scale"""
+        basevals = self.values
+        data_min = np.nanmin(basevals)
+        data_range = np.nanmax(basevals) - data_min
+        # Constant values would divide by zero, leave them unscaled instead
+        scale = 1 / (data_range if data_range >= 10 * np.finfo(basevals.dtype).eps else 1.0)
+        scaled = basevals * scale
+        scaled += 0 - data_min * scale
+        if rounding:
+            self._values = np.round(scaled, self.rounding)
+        else:
+            self._values = scaled.copy()
         return scaled
 
     def add_alignment_event(self):
-        new_shift_event = copy.deepcopy(self.shift_event)
-        new_shift_event["data"][0]["value"] = 0
-        new_shift_event["data"][1]["value"] = 0
-        new_shift_event["data"][2]["value"] = self.ease
-        if not self.entities_list[0]["data"][0]["value"] == 0:
-            dq = deque(self.entities_list)
-            dq.appendleft(new_shift_event)
-            self.entities_list = list(dq)
+        if self.entities_index and self.beats[0] == 0:
             return
-        return
-    
+        self._set_events(
+            np.concatenate([[0], self._beats]),
+            np.concatenate([[0], self._values]),
+            np.concatenate([np.array([self.ease], dtype=np.int8), self._eases]),
+        )
+
     def write_shift_event_references(self):
-        maxlen = len(self.entities_list)
-        # Create a reversed copy for iteration
-        reversed_entities = self.entities_list.copy()
-        reversed_entities.reverse()
-        
-        for i, entity in enumerate(reversed_entities):
-            if i == 0:
-                entity["name"] = hex(maxlen)  # First entity (last in original list)
-                maxlen -= 1
-            else:
-                # Add reference to the previous entity (next in original order)
-                ref_dict = {"name": "next", "ref": hex(maxlen+1)}
-                entity["data"].append(ref_dict)
-                entity["name"] = hex(maxlen)
-                maxlen -= 1
-        
-        reversed_entities.reverse()
-        self.entities_list = reversed_entities
-        return
-
-    def write_to_leveldata(self, filename: Optional[str] = None):
-        self.write_shift_event_references()  # Only used here so only called in here
+        """
+        Builds the LevelData shift event entities: each one is named by its
+        1-based position in hex and references the next event.
+        """
+        return list(self.iter_shift_event_entities(with_references=True))
+
+    def _write_entities_json(self, f, header, entities, compact=True):
+        """
+        Streams header (a dict with an "entities" list) as JSON into the binary file f,
+        appending the entities iterable after the header's own entities in batches
+        so the full document is never built in memory.
+        Returns the number of shift events written.
+        """
+        encode = _json_encoder(compact)
+        # Non-compact output puts every entity on its own line
+        item_separator, key_separator = (",", ":") if compact else (",\n", ": ")
+        item_separator = item_separator.encode()
+
+        fields = {key: value for key, value in header.items() if key != "entities"}
+        opening = encode(fields)[:-1]  # drop the closing brace, entities go last
+        if fields:
+            opening += item_separator
+        f.write(opening + f'"entities"{key_separator}['.encode())
+
+        written = 0
+        all_entities = itertools.chain(header["entities"], entities)
+        while batch := list(itertools.islice(all_entities, WRITE_BATCH_ENTITIES)):
+            f.write((item_separator if written else b"") + item_separator.join(map(encode, batch)))
+            written += len(batch)
+        f.write(b"]}")
+        return written - len(header["entities"])
+
+    def encoded_size(self, as_leveldata=False, compresslevel=DEFAULT_COMPRESSLEVEL, compact=True):
+        """Bytes write_to_leveldata/write_to_json would write right now, without writing a file"""
+        counter = _ByteCounter()
+        if as_leveldata:
+            with gzip.GzipFile(fileobj=counter, mode="wb", compresslevel=compresslevel, mtime=0) as f:
+                self._write_entities_json(f, self.leveldata_header,
+                                          self.iter_shift_event_entities(with_references=True), compact=compact)
+        else:
+            self._write_entities_json(counter, self.json_header, self.iter_shift_event_entities(), compact=compact)
+        return counter.bytes
+
+    def write_to_leveldata(self, filename: Optional[str] = None, compresslevel=DEFAULT_COMPRESSLEVEL,
+                           compact=True, trace_memory=False):
+        """
+        Writes gzipped LevelData, streaming entities into the gzip stream.
+
+        Args:
+            compresslevel: gzip level 0-9, lower is faster
+            compact: Use compact separators instead of one entity per line
+            trace_memory: Also measure peak Python allocations (slows the export down)
+
+        Returns:
+            dict: export report with events, bytes written, seconds and peak_memory_bytes
+        """
         if not filename:
             now = datetime.datetime.now()
             filename = f"{now.day}-{now.month}-{now.year}_output.json"
-        header = copy.deepcopy(self.leveldata_header)
-        print(header)
-        shiftevent_data = self.entities_list.copy()
-        print('-------------------------------------------------------------------------')
-        header["entities"].extend(shiftevent_data)
-        print(header)
-        json_data = json.dumps(header, indent=0)  # 0 indent for compression reasons
-        with gzip.open(filename, "wb") as f:
-            f.write(json_data.encode("utf-8"))
-
-    def write_to_json(self, filename: Optional[str] = None):
+        with profiling.stage("export") as counts:
+            with _ExportReport(filename, trace_memory) as report:
+                with gzip.open(filename, "wb", compresslevel=compresslevel) as f:
+                    report["events"] = self._write_entities_json(
+                        f, self.leveldata_header,
+                        self.iter_shift_event_entities(with_references=True),  # Only used here so only built in here
+                        compact=compact,
+                    )
+            counts.update(events=report["events"], bytes=report["bytes"])
+        return report
+
+    def write_to_json(self, filename: Optional[str] = None, compact=True, trace_memory=False):
+        """
+        Writes the editor JSON, streaming entities into the file.
+
+        Args:
+            compact: Use compact separators instead of one entity per line
+            trace_memory: Also measure peak Python allocations (slows the export down)
+
+        Returns:
+            dict: export report with events, bytes written, seconds and peak_memory_bytes
+        """
         if not filename:
             now = datetime.datetime.now()
             filename = f"{now.day}-{now.month}-{now.year}_output.json"
-        self.json_header["entities"] = self.entities_list
-        with open(filename, "w") as f:
-            json.dump(self.json_header, f, indent=4)
+        with profiling.stage("export") as counts:
+            with _ExportReport(filename, trace_memory) as report:
+                with open(filename, "wb") as f:
+                    report["events"] = self._write_entities_json(
+                        f, self.json_header, self.iter_shift_event_entities(), compact=compact,
+                    )
+            counts.update(events=report["events"], bytes=report["bytes"])
+        return report
+
+def _json_encoder(compact=True):
+    """Returns a function encoding one object to UTF-8 JSON bytes, using orjson when it fits"""
+    if orjson is not None and compact:
+        return orjson.dumps
+    encoder = json.JSONEncoder(separators=(",", ":") if compact else (", ", ": "))
+    return lambda obj: encoder.encode(obj).encode("utf-8")
+
+class _ByteCounter:
+    """Write-only file object that only counts the bytes written to it"""
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+class _ExportReport(dict):
+    """Context manager collecting export time, output size and optionally peak allocations"""
+    def __init__(self, filename, trace_memory=False):
+        super().__init__(filename=str(filename))
+        self.trace_memory = trace_memory
+
+    def __enter__(self):
+        # Tracing may already be on (--profile, other server jobs), so measure from the
+        # current usage and leave stopping it to the last user
+        self._tracing = profiling.tracing() if self.trace_memory else None
+        if self._tracing is not None:
+            self._tracing.__enter__()
+        self._start_memory = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self["seconds"] = time.perf_counter() - self._start
+        if self.trace_memory:
+            self["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1] - self._start_memory
+        if self._tracing is not None:
+            self._tracing.__exit__(*exc_info)
+        if exc_info[0] is None:
+            self["bytes"] = os.path.getsize(self["filename"])
+        return False
@@ -0,0 +1,80 @@
+"""
+Scaling benchmark for BeatSchema redundant shift event removal.
+
+    python benchmarks/bench_dedup.py [--sizes 1000 10000 100000 1000000]
+
+Times validate_unique_shift_events + remove_redundant_shift_events on charts
+with runs of repeated values, next to the previous list.remove() based
+implementation for sizes where it finishes in reasonable time.
+"""
+import argparse
+import copy
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from beatschema import BeatSchema
+
+LEGACY_MAX_EVENTS = 20000
+
+def make_values(n_events, seed=0):
+    """Values rounded to one decimal place, like normalized chart values, so runs are common"""
+    rng = np.random.default_rng(seed)
+    return np.round(np.clip(rng.normal(0.5, 0.2, n_events), 0, 1), 1)
+
+def legacy_remove_redundant(entities_list):
+    """The dict/list.remove() implementation BeatSchema used before the array store"""
+    redundant_events = []
+    current_value = entities_list[0]["data"][1]["value"]
+    current_run = [entities_list[0]]
+    for event in entities_list[1:]:
+        this_value = event["data"][1]["value"]
+        if this_value == current_value:
+            current_run.append(event)
+        else:
+            redundant_events.extend(current_run[:-1])
+            current_value = this_value
+            current_run = [event]
+    redundant_events.extend(current_run[:-1])
+    for event in redundant_events:
+        entities_list.remove(event)
+    return len(redundant_events)
+
+def bench(n_events):
+    values = make_values(n_events)
+    beats = np.arange(n_events) / 8
+
+    schema = BeatSchema(bpm=160)
+    schema.add_shift_events(beats, values)
+    start = time.perf_counter()
+    removed = schema.remove_redundant_shift_events()
+    array_seconds = time.perf_counter() - start
+
+    legacy_seconds = None
+    if n_events <= LEGACY_MAX_EVENTS:
+        entities = BeatSchema(bpm=160)
+        entities.add_shift_events(beats, values)
+        entities_list = copy.deepcopy(entities.entities_list)
+        start = time.perf_counter()
+        legacy_removed = legacy_remove_redundant(entities_list)
+        legacy_seconds = time.perf_counter() - start
+        assert legacy_removed == removed
+
+    return removed, array_seconds, legacy_seconds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    print(f"{'events':>10}  {'removed':>10}  {'arrays':>10}  {'legacy':>10}")
+    for n_events in args.sizes:
+        removed, array_seconds, legacy_seconds = bench(n_events)
+        legacy = f"{legacy_seconds:9.4f}s" if legacy_seconds is not None else f"{'-':>10}"
+        print(f"{n_events:>10}  {removed:>10}  {array_seconds:9.4f}s  {legacy}")
+
+if __name__ == "__main__":
+    main()
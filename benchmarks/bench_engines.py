@@ -0,0 +1,81 @@
+"""
+Band energy engine benchmark: per-segment FFTs against the streaming IIR filter bank.
+
+    python benchmarks/bench_engines.py [--seconds 600] [--divisions 4 16 32] [--decimate 2000]
+
+Times every engine, with and without decimation, on one synthetic stereo track:
+in-memory analysis of an already decoded signal (downmix included) and streaming
+analysis straight from the file. Also reports how closely each engine's bass
+energy curve and normalized values follow the plain FFT engine.
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import bass_bouncer
+from synth import ensure_track
+
+DEFAULT_AUDIO_DIR = Path(__file__).resolve().parent / "audio"
+
+def timed(function, trace_memory):
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, seconds, peak
+
+def normalized(bands, rate, beat_duration, samples_per_segment, division):
+    return bass_bouncer.bass_data_from_bands(
+        bands, rate, beat_duration, samples_per_segment, beat_division=division,
+        threshold_vals=("min", "max"), smoothing_algo="none", transient_focus=0.9)["normalized_values"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=600, help="Track length (default: 600)")
+    parser.add_argument("--bpm", type=float, default=160)
+    parser.add_argument("--divisions", type=int, nargs="+", default=[4, 16, 32])
+    parser.add_argument("--decimate", type=int, default=bass_bouncer.DEFAULT_DECIMATION_RATE, help="Target rate of the decimated variants")
+    parser.add_argument("--audio-dir", type=str, default=str(DEFAULT_AUDIO_DIR))
+    parser.add_argument("--no-memory", action="store_false", dest="trace_memory", default=True, help="Skip the traced peak memory runs")
+    args = parser.parse_args()
+
+    path = ensure_track(args.audio_dir, bpm=args.bpm, seconds=args.seconds, channels=2, dtype="int16")
+    rate, data = bass_bouncer.load_channels(path)
+    # Pay the deferred scipy.signal import and filter designs outside the timings
+    bass_bouncer.BassFilterBank(rate, rate, args.decimate)
+
+    variants = [("fft", None), ("fft", args.decimate), ("iir", None), ("iir", args.decimate)]
+    print(f"{path.name}, {args.seconds:.0f}s at {rate} Hz")
+    print(f"{'division':>8}  {'engine':<14}  {'memory':>9}  {'stream':>9}  {'x realtime':>10}  {'peak mem':>9}  "
+          f"{'bass corr':>9}  {'value diff':>10}")
+    for division in args.divisions:
+        beat_duration, samples_per_segment = bass_bouncer.segment_length(rate, args.bpm, division)
+        reference = None
+        for engine, target_rate in variants:
+            bands, seconds, peak = timed(lambda: bass_bouncer.signal_band_energies(
+                data, samples_per_segment, rate, engine, target_rate), args.trace_memory)
+            _, stream_seconds, _ = timed(lambda: bass_bouncer.stream_band_energies(
+                path, bpm=args.bpm, beat_division=division, target_rate=target_rate, engine=engine), False)
+            bass, _ = bass_bouncer.energies_from_bands(bands)
+            values = normalized(bands, rate, beat_duration, samples_per_segment, division)
+            if reference is None:
+                reference = bass, values
+            correlation = np.corrcoef(bass, reference[0])[0, 1]
+            difference = np.mean(np.abs(values - reference[1]))
+            label = engine + (f"@{target_rate}" if target_rate else "")
+            peak = f"{peak / 1024 / 1024:7.1f}MB" if peak is not None else f"{'-':>9}"
+            print(f"{division:>8}  {label:<14}  {seconds:8.3f}s  {stream_seconds:8.3f}s  "
+                  f"{args.seconds / seconds:10.0f}  {peak}  {correlation:9.3f}  {difference:10.3f}")
+
+if __name__ == "__main__":
+    main()
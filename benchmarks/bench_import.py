@@ -0,0 +1,92 @@
+"""
+Startup benchmark for the command line entry points.
+
+    python benchmarks/bench_import.py [--runs 5] [--save baseline.json | --check baseline.json]
+
+Times `import <module>` and `<script> --help` in fresh interpreters, and lists which
+heavy dependencies each one pulls in. Startup paths must not import anything in
+HEAVY_MODULES, and --check fails when a median time regresses by more than
+--tolerance (and at least --min-delta seconds) against a saved baseline.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+# Modules that only the analysis itself may load
+HEAVY_MODULES = ("numpy", "scipy", "sklearn")
+
+CASES = {
+    "import main": ["-c", "import main"],
+    "import batch": ["-c", "import batch"],
+    "main.py --help": ["main.py", "--help"],
+    "batch.py --help": ["batch.py", "--help"],
+    "client.py --help": ["client.py", "--help"],
+    "sweep.py --help": ["sweep.py", "--help"],
+}
+
+def time_case(args, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=REPO_DIR, capture_output=True, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def loaded_heavy_modules(args):
+    """Runs the case with -X importtime and returns the heavy top-level modules it imported"""
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=REPO_DIR,
+                            capture_output=True, text=True, check=True)
+    loaded = set()
+    for line in result.stderr.splitlines():
+        name = line.rsplit("|", 1)[-1].strip()
+        if name.split(".")[0] in HEAVY_MODULES:
+            loaded.add(name.split(".")[0])
+    return sorted(loaded)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per case (default: 5)")
+    parser.add_argument("--save", type=str, default=None, help="Write the results to this JSON baseline")
+    parser.add_argument("--check", type=str, default=None, help="Compare against this JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown vs the baseline (default: 0.25 = 25%%)")
+    parser.add_argument("--min-delta", type=float, default=0.05, help="Slowdowns under this many seconds are noise (default: 0.05)")
+    args = parser.parse_args()
+
+    baseline_seconds = time_case(["-c", "pass"], args.runs)
+    results = {"interpreter_seconds": baseline_seconds, "cases": {}}
+    print(f"{'case':<18}  {'median':>9}  {'over bare':>9}  heavy modules")
+    print(f"{'python -c pass':<18}  {baseline_seconds:8.3f}s  {'':>9}")
+    failures = []
+    for name, case_args in CASES.items():
+        seconds = time_case(case_args, args.runs)
+        heavy = loaded_heavy_modules(case_args)
+        results["cases"][name] = {"seconds": seconds, "heavy_modules": heavy}
+        print(f"{name:<18}  {seconds:8.3f}s  {seconds - baseline_seconds:8.3f}s  {', '.join(heavy) or '-'}")
+        if heavy:
+            failures.append(f"{name} imports {', '.join(heavy)}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if args.check:
+        with open(args.check) as f:
+            baseline = json.load(f)
+        for name, result in results["cases"].items():
+            previous = baseline["cases"].get(name)
+            limit = max(previous["seconds"] * (1 + args.tolerance), previous["seconds"] + args.min_delta) if previous else None
+            if limit is not None and result["seconds"] > limit:
+                failures.append(f"{name} took {result['seconds']:.3f}s, baseline {previous['seconds']:.3f}s")
+
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Quantile sketch accuracy check: threshold percentiles of single, chunked and merged
+sketches (including merges of already compressed sketches, like long tracks in
+batch.py --album-thresholds) against np.percentile of all values.
+
+    python benchmarks/bench_sketch.py [--values 200000] [--tracks 8] [--max-rank-error 0.002]
+
+Exits with status 1 when any percentile is off by more than --max-rank-error in
+rank (fraction of the values) or isn't monotone.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bass_bouncer import THRESHOLD_PERCENTILES
+from quantile_sketch import QuantileSketch
+
+def rank_errors(sorted_values, estimates, percentiles):
+    """How far each estimate's rank is from the percentile it estimates, as a fraction of the values"""
+    ranks = np.searchsorted(sorted_values, estimates) / len(sorted_values)
+    return np.abs(ranks - np.asarray(percentiles) / 100)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--values", type=int, default=200000, help="Values per track (default: 200000)")
+    parser.add_argument("--tracks", type=int, default=8, help="Tracks merged in the album cases (default: 8)")
+    parser.add_argument("--chunk", type=int, default=4096, help="Values per update() in the chunked case (default: 4096)")
+    parser.add_argument("--max-rank-error", type=float, default=0.002, help="Allowed rank error (default: 0.002 = 0.2%%)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    # Energy-like, skewed values with a different level per track
+    tracks = [rng.lognormal(rng.uniform(-1, 1), rng.uniform(0.5, 1.5), args.values) for _ in range(args.tracks)]
+    percentiles = list(THRESHOLD_PERCENTILES.values())
+
+    def chunked(values):
+        sketch = QuantileSketch()
+        for start in range(0, len(values), args.chunk):
+            sketch.update(values[start:start + args.chunk])
+        return sketch
+
+    cases = {
+        "single": (lambda: QuantileSketch().update(tracks[0]), tracks[:1]),
+        "chunked": (lambda: chunked(tracks[0]), tracks[:1]),
+        "merged compressed": (lambda: QuantileSketch.merged(QuantileSketch().update(t) for t in tracks), tracks),
+        "merged chunked": (lambda: QuantileSketch.merged(chunked(t) for t in tracks), tracks),
+        "merged exact": (lambda: QuantileSketch.merged((QuantileSketch(exact=True).update(t) for t in tracks), exact=True),
+                         tracks),
+        "merged small": (lambda: QuantileSketch.merged(QuantileSketch().update(t[:1000]) for t in tracks),
+                         [t[:1000] for t in tracks]),
+    }
+
+    failed = False
+    print(f"{'case':<20}  {'seconds':>8}  {'centroids':>9}  {'max rank err':>12}  {'max rel err':>11}")
+    for name, (build, values) in cases.items():
+        start = time.perf_counter()
+        sketch = build()
+        estimates = sketch.percentile(percentiles)
+        seconds = time.perf_counter() - start
+        everything = np.sort(np.concatenate(values))
+        exact = np.percentile(everything, percentiles)
+        rank_error = rank_errors(everything, estimates, percentiles).max()
+        relative_error = np.max(np.abs(estimates - exact) / exact)
+        centroids = len(sketch._means) if sketch._means is not None else 0
+        ok = rank_error <= args.max_rank_error and np.all(np.diff(estimates) >= 0)
+        failed |= not ok
+        print(f"{name:<20}  {seconds:8.3f}  {centroids:9d}  {rank_error:12.5f}  {relative_error:11.5f}"
+              + ("" if ok else "  FAIL"))
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Benchmark suite for the analysis and export pipeline.
+
+    python benchmarks/run_benchmarks.py --output report.json
+    python benchmarks/run_benchmarks.py --lengths 30 600 3600 --divisions 4 32 --output big.json
+    python benchmarks/run_benchmarks.py --output new.json --compare report.json
+
+Generates deterministic synthetic tracks (see synth.py), then times every pipeline
+stage per track and beat division: decode, FFT, thresholds, the smoothing variants,
+schema build, dedup and export. Each stage records wall time, throughput in audio
+seconds per wall second and, unless --no-memory is given, peak traced allocations
+from a second, separately traced run. The report is JSON so runs can be compared.
+"""
+import argparse
+import datetime
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import bass_bouncer
+from beatschema import BeatSchema
+from synth import ensure_track
+
+DEFAULT_AUDIO_DIR = Path(__file__).resolve().parent / "audio"
+SMOOTHING_ALGOS = ("none", "convolution", "cross_correlation", "auto_correlation")
+
+def measure(function, trace_memory):
+    """Runs function once for timing and, if asked, once more under tracemalloc for peak memory"""
+    start = time.perf_counter()
+    result = function()
+    stats = {"seconds": time.perf_counter() - start}
+    if trace_memory:
+        tracemalloc.start()
+        function()
+        stats["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, stats
+
+def bench_track(path, audio_seconds, divisions, bpm, trace_memory, export_dir):
+    """Times every pipeline stage on one track, returns one case dict per division"""
+    stages = {}
+    (rate, data), stages["decode"] = measure(lambda: bass_bouncer.load_mono(path), trace_memory)
+    cases = []
+    for division in divisions:
+        division_stages = dict(stages)
+        beat_duration, samples_per_segment = bass_bouncer.segment_length(rate, bpm, division)
+
+        bands, division_stages["fft"] = measure(
+            lambda: bass_bouncer.segment_band_energies(data, samples_per_segment, rate), trace_memory)
+        _, division_stages["stream_decode_fft"] = measure(
+            lambda: bass_bouncer.stream_band_energies(path, bpm=bpm, beat_division=division), trace_memory)
+
+        def thresholds():
+            bass_energies, transient_energies = bass_bouncer.energies_from_bands(bands)
+            return bass_bouncer.calculate_thresholds(bass_energies), bass_bouncer.calculate_thresholds(transient_energies)
+        _, division_stages["thresholds"] = measure(thresholds, trace_memory)
+
+        for algo in SMOOTHING_ALGOS:
+            result, division_stages[f"smoothing_{algo}"] = measure(
+                lambda: bass_bouncer.bass_data_from_bands(
+                    bands, rate, beat_duration, samples_per_segment, beat_division=division,
+                    smoothing_window=5, threshold_vals=("min", "max"), smoothing_algo=algo, transient_focus=0.9),
+                trace_memory)
+            if algo == "none":
+                bass_data = result
+
+        def build_schema():
+            schema = BeatSchema(bpm=bpm)
+            schema.add_shift_events(bass_data["beats"], bass_data["normalized_values"])
+            return schema
+        schema, division_stages["schema_build"] = measure(build_schema, trace_memory)
+        n_events = schema.entities_index
+
+        def dedup():
+            deduped = build_schema()
+            deduped.remove_redundant_shift_events()
+            return deduped
+        _, division_stages["dedup"] = measure(dedup, trace_memory)
+        # dedup includes the build it needs as input, report only its own share
+        division_stages["dedup"]["seconds"] = max(
+            0.0, division_stages["dedup"]["seconds"] - division_stages["schema_build"]["seconds"])
+        schema.remove_redundant_shift_events()
+        schema.scale_minmax()
+        schema.add_alignment_event()
+
+        export_path = Path(export_dir) / f"{Path(path).stem}_{division}.LevelData"
+        _, division_stages["export"] = measure(lambda: schema.write_to_leveldata(export_path), trace_memory)
+
+        for stats in division_stages.values():
+            stats["throughput"] = audio_seconds / stats["seconds"] if stats["seconds"] else None
+        cases.append({
+            "division": division,
+            "segments": len(bands),
+            "events": n_events,
+            "events_after_dedup": schema.entities_index,
+            "stages": division_stages,
+        })
+    return cases
+
+def case_key(case):
+    track = case["track"]
+    return (track["seconds"], track["channels"], track["dtype"], case["division"])
+
+def compare(report, previous):
+    """Prints per-stage time ratios against a previous report for matching cases"""
+    previous_cases = {case_key(case): case for case in previous["cases"] if "stages" in case}
+    print(f"\n{'case':<34}  {'stage':<28}  {'before':>9}  {'after':>9}  {'ratio':>6}")
+    for case in report["cases"]:
+        old = previous_cases.get(case_key(case))
+        if old is None or "stages" not in case:
+            continue
+        label = "{}s {}ch {} div {}".format(*case_key(case))
+        for stage, stats in case["stages"].items():
+            if stage not in old["stages"]:
+                continue
+            before, after = old["stages"][stage]["seconds"], stats["seconds"]
+            ratio = after / before if before else float("nan")
+            flag = "  slower" if ratio > 1.1 else "  faster" if ratio < 0.9 else ""
+            print(f"{label:<34}  {stage:<28}  {before:8.4f}s  {after:8.4f}s  {ratio:6.2f}{flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=float, nargs="+", default=[30, 300], help="Track lengths in seconds (default: 30 300)")
+    parser.add_argument("--channels", type=int, nargs="+", default=[1, 2], help="Channel counts (default: 1 2)")
+    parser.add_argument("--dtypes", nargs="+", default=["int16", "int32", "float32"], help="Sample formats (default: int16 int32 float32)")
+    parser.add_argument("--divisions", type=int, nargs="+", default=[4, 16, 32], help="Beat divisions (default: 4 16 32)")
+    parser.add_argument("--bpm", type=float, default=160, help="Tempo of the synthetic tracks (default: 160)")
+    parser.add_argument("--audio-dir", type=str, default=str(DEFAULT_AUDIO_DIR), help="Where generated tracks are kept between runs")
+    parser.add_argument("--no-memory", action="store_false", dest="trace_memory", default=True, help="Skip the traced peak memory runs")
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report here")
+    parser.add_argument("--compare", type=str, default=None, help="Previous JSON report to compare against")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+        },
+        "cases": [],
+    }
+    # Pay the deferred scipy import up front so it doesn't land in the first decode
+    import scipy.io.wavfile  # noqa: F401, only imported for its import time
+
+    with tempfile.TemporaryDirectory() as export_dir:
+        for seconds, channels, dtype in product(args.lengths, args.channels, args.dtypes):
+            track = {"bpm": args.bpm, "seconds": seconds, "channels": channels, "dtype": dtype}
+            path = ensure_track(args.audio_dir, **track)
+            print(f"{path.name}")
+            try:
+                cases = bench_track(path, seconds, args.divisions, args.bpm, args.trace_memory, export_dir)
+            except Exception as e:
+                # Keep going so one unsupported format doesn't lose the whole run
+                print(f"  failed: {type(e).__name__}: {e}")
+                report["cases"].append({"track": track, "division": None, "error": f"{type(e).__name__}: {e}"})
+                continue
+            for case in cases:
+                case["track"] = track
+                report["cases"].append(case)
+                total = sum(stats["seconds"] for stats in case["stages"].values())
+                print(f"  division {case['division']:>3}: {case['segments']} segments, "
+                      f"{case['events_after_dedup']} events, {total:.3f}s over all stages")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
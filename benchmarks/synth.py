@@ -0,0 +1,100 @@
+"""
+Deterministic synthetic test tracks: a kick on every beat and a bass note on
+every offbeat at a known BPM, over a little noise.
+
+    python benchmarks/synth.py out.wav --bpm 160 --seconds 30 --channels 2 --dtype int16
+
+Tracks are generated and written block by block, so hour-long files don't need
+to fit in memory, and the same arguments always produce the same bytes.
+"""
+import argparse
+import struct
+from pathlib import Path
+
+import numpy as np
+
+BLOCK_FRAMES = 1 << 18
+DTYPES = {
+    # dtype name: (numpy dtype, WAV format tag, full scale)
+    "int16": (np.dtype("<i2"), 1, 32767),
+    "int32": (np.dtype("<i4"), 1, 2147483647),
+    "float32": (np.dtype("<f4"), 3, 1.0),
+}
+
+def wav_header(rate, channels, dtype, n_frames):
+    numpy_dtype, format_tag, _ = DTYPES[dtype]
+    block_align = channels * numpy_dtype.itemsize
+    data_size = n_frames * block_align
+    fmt = struct.pack("<HHIIHH", format_tag, channels, rate, rate * block_align, block_align,
+                      numpy_dtype.itemsize * 8)
+    return (b"RIFF" + struct.pack("<I", 4 + 8 + len(fmt) + 8 + data_size) + b"WAVE"
+            + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+            + b"data" + struct.pack("<I", data_size))
+
+def synth_block(start_frame, n_frames, rate, bpm, channels, seed):
+    """Float signal in [-1, 1] for frames [start_frame, start_frame + n_frames)"""
+    t = (start_frame + np.arange(n_frames)) / rate
+    beat = 60 / bpm
+    since_beat = t % beat
+    since_offbeat = (t + beat / 2) % beat
+
+    # Kick: pitch drops from ~110 Hz to 45 Hz with a fast decay
+    kick_phase = 2 * np.pi * (45 * since_beat + 65 / 30 * (1 - np.exp(-30 * since_beat)))
+    kick = np.sin(kick_phase) * np.exp(-10 * since_beat)
+    # Bass: a four-note line on the offbeats
+    note = ((t + beat / 2) // beat).astype(np.int64) % 4
+    bass_hz = np.array([55.0, 65.4, 73.4, 82.4])[note]
+    bass = 0.5 * np.sin(2 * np.pi * bass_hz * since_offbeat) * np.exp(-6 * since_offbeat)
+
+    rng = np.random.default_rng([seed, start_frame])
+    signal = np.empty((n_frames, channels))
+    for channel in range(channels):
+        # Pan the bass a little differently per channel so channels aren't identical
+        pan = 1 - channel / max(channels, 2)
+        signal[:, channel] = 0.6 * kick + 0.3 * pan * bass + 0.02 * rng.standard_normal(n_frames)
+    return signal
+
+def write_track(path, bpm=160, seconds=30, channels=2, dtype="int16", rate=48000, seed=0):
+    """Writes a synthetic WAV to path and returns the path"""
+    numpy_dtype, _, full_scale = DTYPES[dtype]
+    n_frames = int(round(seconds * rate))
+    with open(path, "wb") as f:
+        f.write(wav_header(rate, channels, dtype, n_frames))
+        for start in range(0, n_frames, BLOCK_FRAMES):
+            block = synth_block(start, min(BLOCK_FRAMES, n_frames - start), rate, bpm, channels, seed)
+            samples = np.clip(block * 0.9, -1, 1) * full_scale
+            if channels == 1:
+                samples = samples[:, 0]
+            if numpy_dtype.kind == "i":
+                samples = np.round(samples)
+            f.write(samples.astype(numpy_dtype).tobytes())
+    return path
+
+def track_name(bpm, seconds, channels, dtype, rate=48000, seed=0):
+    return f"synth_{bpm}bpm_{seconds}s_{channels}ch_{dtype}_{rate}hz_s{seed}.wav"
+
+def ensure_track(directory, **params):
+    """Returns the path of a generated track in directory, writing it if it doesn't exist yet"""
+    path = Path(directory) / track_name(**params)
+    if not path.exists():
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        write_track(tmp_path, **params)
+        tmp_path.replace(path)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output", type=str, help="Output WAV path")
+    parser.add_argument("--bpm", type=float, default=160)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--dtype", choices=sorted(DTYPES), default="int16")
+    parser.add_argument("--rate", type=int, default=48000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_track(args.output, bpm=args.bpm, seconds=args.seconds, channels=args.channels,
+                dtype=args.dtype, rate=args.rate, seed=args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Thin client for server.py: takes main.py's arguments, has the warm server run the
+job and prints its output, so a call costs milliseconds instead of a fresh start.
+
+    python client.py song.wav 128 --output song.json
+    python client.py song.wav auto --socket /tmp/bouncer.sock
+
+Falls back to running the job in this process when no server is reachable.
+"""
+import http.client
+import json
+import os
+import socket
+import sys
+
+from main import build_parser, check_args, run
+
+DEFAULT_SERVER = "127.0.0.1:8765"
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a Unix socket"""
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+def absolute_paths(args):
+    """Resolves path arguments against this directory, the server's working directory can differ"""
+    args.wav_path = os.path.abspath(args.wav_path)
+    args.output = os.path.abspath(args.output)
+    if args.stems:
+        args.stems = [os.path.abspath(stem) for stem in args.stems]
+    if args.cache:
+        args.cache = os.path.abspath(args.cache)
+    if args.profile not in (None, "-"):
+        args.profile = os.path.abspath(args.profile)
+
+def request(connection, method, path, body=None):
+    """Sends one request, returns (status, decoded JSON reply)"""
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+def connect(server=DEFAULT_SERVER, socket_path=None):
+    if socket_path is not None:
+        return UnixHTTPConnection(socket_path)
+    host, _, port = server.rpartition(":")
+    return http.client.HTTPConnection(host, int(port))
+
+def main():
+    parser = build_parser()
+    parser.add_argument("--server", type=str, default=DEFAULT_SERVER, metavar="HOST:PORT", help=f"Analysis server address (default: {DEFAULT_SERVER})")
+    parser.add_argument("--socket", type=str, default=None, metavar="PATH", help="Connect to the server's Unix socket instead")
+    args = parser.parse_args()
+    check_args(parser, args)
+    connection = connect(args.server, args.socket)
+    del args.server, args.socket
+    absolute_paths(args)
+
+    try:
+        status, reply = request(connection, "POST", "/analyze", {"args": vars(args)})
+    except (ConnectionError, FileNotFoundError) as e:
+        print(f"No analysis server ({e}), running locally", file=sys.stderr)
+        run(args)
+        return
+    if status != 200:
+        print(f"Analysis failed: {reply['error']}", file=sys.stderr)
+        sys.exit(1)
+    sys.stdout.write(reply["stdout"])
+    sys.stderr.write(reply["stderr"])
+
+if __name__ == "__main__":
+    main()
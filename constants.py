@@ -0,0 +1,20 @@
+"""
+Analysis constants shared by bass_bouncer.py and the command line entry points.
+Kept free of numpy and scipy so argparse setup and --help stay fast.
+"""
+
+# Bass bands as (low_hz, high_hz), in the column order used by band energy arrays
+BASS_BANDS = {
+    'sub': (20, 60),      # Sub-bass (20-60 Hz)
+    'punch': (60, 120),   # Punchy bass (60-120 Hz)
+    'upper': (120, 250),  # Upper bass (120-250 Hz)
+}
+
+# Sample rate the bass band is decimated to by --decimate without a rate
+DEFAULT_DECIMATION_RATE = 2000
+
+# Band energy engines: per-segment FFTs, or a continuous band-pass filter bank
+ANALYSIS_ENGINES = ('fft', 'iir')
+
+# Smoothing algorithms bass_data_from_bands and sweep_bass_data accept
+SMOOTHING_ALGOS = ('convolution', 'cross_correlation', 'auto_correlation', 'none')
@@ -1,44 +1,247 @@
-from bass_bouncer import generate_bass_data
-from beatschema import BeatSchema
+from analysis_cache import AnalysisCache, DEFAULT_CACHE_DIR
+from contextlib import nullcontext
+from pathlib import Path
 import argparse
+import json
+import sys
+import time
+import profiling
+from constants import ANALYSIS_ENGINES, BASS_BANDS, DEFAULT_DECIMATION_RATE
 
-def main():
+VALID_BOUNDS = "min,low,mid,high,max".split(',')
+
+def parse_min_max(min_max):
+    """Splits a "lower,upper" bounds string and checks both are threshold keys"""
+    bounds = min_max.split(',')
+    if len(bounds) != 2 or bounds[0] not in VALID_BOUNDS or bounds[1] not in VALID_BOUNDS:
+        raise ValueError(f"Invalid bounds {min_max!r}, expected two of {', '.join(VALID_BOUNDS)} like min,max")
+    return bounds[0], bounds[1]
+
+def check_decimation_rate(rate):
+    """Checks a --decimate rate keeps the bass bands clear of aliasing, None meaning no decimation"""
+    top_hz = max(high for _, high in BASS_BANDS.values())
+    if rate is not None and rate <= 2 * top_hz:
+        raise ValueError(f"--decimate rate must be above {2 * top_hz} Hz to keep bass up to {top_hz} Hz, got {rate}")
+
+def parse_bpm(value):
+    """argparse type for a BPM: a positive number, or "auto" to detect it"""
+    if value == "auto":
+        return value
+    try:
+        bpm = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"BPM must be a number or 'auto', got {value!r}")
+    if bpm <= 0:
+        raise argparse.ArgumentTypeError(f"BPM must be positive, got {value!r}")
+    return int(bpm) if bpm.is_integer() else bpm
+
+def lane_output_path(output, lane):
+    """Output file for one lane of a multi-lane run: song.json -> song_lane1.json"""
+    output = Path(output)
+    return str(output.with_name(f"{output.stem}_lane{lane}{output.suffix}"))
+
+def build_beat_schema(beats, normalized_values, bpm, lane=0, rounding=True):
+    """BeatSchema of one lane's normalized values, deduplicated, scaled and aligned like every export"""
+    from beatschema import BeatSchema
+
+    beat_schema = BeatSchema(bpm=bpm, lane=lane)
+    beat_schema.add_shift_events(beats, normalized_values)
+    beat_schema.validate_unique_shift_events()
+    beat_schema.remove_redundant_shift_events()
+    beat_schema.scale_minmax(rounding)
+    beat_schema.add_alignment_event()
+    return beat_schema
+
+def process_track(wav_path, bpm, output, beat_division=4, smoothing_window=5, min_max="min,max",
+                  rounding=True, as_leveldata=False, stream=False, cache=None,
+                  compresslevel=None, compact=True, trace_memory=False, profile=False,
+                  per_channel=False, stems=None, workers=None, target_rate=None, engine="fft", thresholds=None,
+                  simplify=None):
+    """
+    Runs the full pipeline for one track: bass analysis, BeatSchema build and export.
+    bpm can be "auto" to estimate it from the audio.
+
+    With per_channel or stems every channel or stem file is analyzed separately in
+    a thread pool and exported as its own lane, to output with a _lane<n> suffix.
+
+    Args:
+        profile: Record per-stage wall time, CPU time and peak allocations (see profiling.py)
+        per_channel: One lane per channel of wav_path instead of a mono downmix
+        stems: Extra stem files analyzed as lanes after wav_path
+        workers: Threads for per-channel/stem analysis (default: one per lane, up to the CPU count)
+        target_rate: Decimate the bass band to about this sample rate before the FFTs
+        engine: Band energy engine, "fft" (per-segment FFTs) or "iir" (continuous filter bank)
+        thresholds: Fixed thresholds dict (e.g. album-wide) to normalize with instead of the track's own
+        simplify: Drop shift events reproducible within this value tolerance by interpolation
+                  (see BeatSchema.simplify_shift_events); the export reports get the event
+                  counts and the size the unsimplified chart would have had
+
+    Returns:
+        dict: events written over all lanes, bpm used, the BPM confidence (None unless
+              estimated), the per-lane export reports and, with profile, the stage report
+    """
+    # Imported here so --help and argument errors don't pay for numpy/scipy
+    from bass_bouncer import generate_bass_data, generate_lane_bass_data, estimate_bpm
+
+    min_bound, max_bound = parse_min_max(min_max)
+    if (target_rate or engine != "fft") and (per_channel or stems):
+        raise ValueError("Decimation and the iir engine are not supported together with per-channel or stem lanes")
+    bpm_confidence = None
+    start = time.perf_counter()
+    with profiling.profile() if profile else nullcontext() as profiler:
+        if bpm == "auto":
+            with profiling.stage("estimate_bpm"):
+                bpm, bpm_confidence = estimate_bpm(wav_path, stream=stream, cache=cache, target_rate=target_rate, engine=engine)
+        bass_options = dict(
+            bpm=bpm,
+            beat_division=beat_division,
+            smoothing_window=smoothing_window,
+            threshold_vals=tuple([min_bound, max_bound]),
+            smoothing_algo='none',
+            transient_focus=0.9,
+            stream=stream,
+            cache=cache,
+            thresholds=thresholds)
+        with profiling.stage("analysis"):
+            if per_channel or stems:
+                lanes = generate_lane_bass_data(wav_path, stems=stems, workers=workers, **bass_options)
+                outputs = [lane_output_path(output, lane) for lane in range(len(lanes))]
+            else:
+                lanes = [generate_bass_data(wav_path, target_rate=target_rate, engine=engine, **bass_options)]
+                outputs = [output]
+
+        exports = []
+        for lane, (bass_data, lane_output) in enumerate(zip(lanes, outputs)):
+            beat_schema = build_beat_schema(bass_data['beats'], bass_data['normalized_values'], bpm, lane, rounding)
+            options = {} if compresslevel is None or not as_leveldata else {"compresslevel": compresslevel}
+            simplified = None
+            if simplify:
+                # One extra encode, to report what simplifying saved
+                bytes_before = beat_schema.encoded_size(as_leveldata, compact=compact, **options)
+                simplified = beat_schema.simplify_shift_events(simplify)
+                simplified["bytes_before"] = bytes_before
+            if as_leveldata:
+                exports.append(beat_schema.write_to_leveldata(lane_output, compact=compact, trace_memory=trace_memory, **options))
+            else:
+                exports.append(beat_schema.write_to_json(lane_output, compact=compact, trace_memory=trace_memory))
+            if simplified is not None:
+                exports[-1]["simplify"] = simplified
+
+    summary = {
+        "events": sum(export["events"] for export in exports),
+        "bpm": bpm,
+        "bpm_confidence": bpm_confidence,
+        "exports": exports,
+    }
+    if profile:
+        summary["profile"] = profiler.report(
+            track=str(wav_path), bpm=bpm, beat_division=beat_division, stream=stream, lanes=len(exports),
+            events=summary["events"], wall_seconds=time.perf_counter() - start)
+    return summary
+
+def build_parser():
+    """The CLI's argument parser, shared with client.py so the daemon takes the same arguments"""
     parser = argparse.ArgumentParser()
     parser.add_argument("wav_path", type=str, help="Path to the WAV file")
-    parser.add_argument("bpm", type=int, help="Beats per minute, mandatory arg, pls find bpm on your own")
+    parser.add_argument("bpm", type=parse_bpm, help="Beats per minute, or 'auto' to estimate it from the bass onsets")
     parser.add_argument("--beat_division", type=int, default=4, help="Number of segments per beat (default: 4)")
     parser.add_argument("--smoothing_window", type=int, default=5, help="Window size for smoothing algorithm (default: 5)")
     parser.add_argument("--output", type=str, default="output.json", help="Output file name (default: output.json)")
     parser.add_argument("--min-max", type=str, default="min,max", help="Comma separated string of 2 values to decide bounds (default: min,max). Valid values: min, low, mid, high, max")
     parser.add_argument("--no-round", action="store_false", default=True, help="Disable rounding of minmaxed values (default: True)")
     parser.add_argument("--as-leveldata", action="store_true", default=False, help="Output as LevelData (default: False)")
-    args = parser.parse_args()
+    parser.add_argument("--stream", action="store_true", default=False, help="Read the WAV in blocks to keep memory constant on long tracks (default: False)")
+    parser.add_argument("--cache", nargs="?", const=str(DEFAULT_CACHE_DIR), default=None, help=f"Cache band energies on disk so reruns skip decoding and FFT (default dir: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--cache-size", type=int, default=512, help="Maximum cache size in MB before least recently used entries are evicted (default: 512)")
+    parser.add_argument("--compresslevel", type=int, default=None, choices=range(10), metavar="{0-9}", help="gzip level for LevelData, lower is faster (default: 6)")
+    parser.add_argument("--pretty", action="store_false", dest="compact", default=True, help="Write one entity per line instead of compact JSON")
+    parser.add_argument("--export-stats", action="store_true", default=False, help="Print export time, size and peak memory")
+    parser.add_argument("--per-channel", action="store_true", default=False, help="Analyze every channel separately, one output lane each, instead of a mono downmix")
+    parser.add_argument("--stems", type=str, nargs="+", default=None, metavar="WAV", help="Stem files analyzed separately as extra lanes after wav_path")
+    parser.add_argument("--workers", type=int, default=None, help="Threads for --per-channel/--stems analysis (default: one per lane, up to the CPU count)")
+    parser.add_argument("--decimate", nargs="?", type=int, const=DEFAULT_DECIMATION_RATE, default=None, metavar="RATE", help=f"Low-pass and decimate to about RATE Hz before the FFTs, faster with near-identical output (default rate: {DEFAULT_DECIMATION_RATE})")
+    parser.add_argument("--engine", choices=ANALYSIS_ENGINES, default="fft", help="Band energy engine: per-segment FFTs, or band-pass filters run continuously over the track (default: fft)")
+    parser.add_argument("--simplify", type=float, default=None, metavar="TOLERANCE", help="Drop shift events whose value interpolating between their neighbours reproduces within TOLERANCE (e.g. 0.05)")
+    parser.add_argument("--validate-decimation", action="store_true", default=False, help="Compare decimated and full-rate analysis of wav_path and print the error report as JSON instead of exporting")
+    parser.add_argument("--profile", nargs="?", const="-", default=None, metavar="PATH", help="Write per-stage wall time, CPU time and peak memory as JSON to PATH (default: stdout)")
+    return parser
 
-    beat_schema = BeatSchema(bpm=args.bpm)
-    min_bound, max_bound = args.min_max.split(',')
-    valid_values = "min,low,mid,high,max".split(',')
-    assert min_bound in valid_values and max_bound in valid_values
+def check_args(parser, args):
+    """Argument checks argparse can't express, exits through parser.error like it"""
+    try:
+        parse_min_max(args.min_max)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        check_decimation_rate(args.decimate)
+    except ValueError as e:
+        parser.error(str(e))
+    if (args.decimate is not None or args.engine != "fft") and (args.per_channel or args.stems):
+        parser.error("--decimate and --engine iir can't be combined with --per-channel or --stems")
+    if args.validate_decimation and args.bpm == "auto":
+        parser.error("--validate-decimation needs a fixed BPM")
 
-    bass_data = generate_bass_data(
-        args.wav_path, 
-        bpm=args.bpm, 
-        beat_division=args.beat_division, 
-        smoothing_window=args.smoothing_window,
-        threshold_vals=tuple([min_bound, max_bound]),
-        smoothing_algo='none',
-        transient_focus=0.9)
+def run(args, cache=None, stdout=None, stderr=None):
+    """
+    Runs parsed CLI arguments. cache overrides the --cache one (the daemon passes its
+    in-memory cache), stdout/stderr redirect the printed output.
+    """
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    if cache is None and args.cache:
+        cache = AnalysisCache(args.cache, args.cache_size * 1024 * 1024)
 
-    for segment in bass_data['segments']:
-        beat_schema.add_shift_event(segment['beat'], segment['normalized_value'])
+    if args.validate_decimation:
+        from bass_bouncer import validate_decimation
+        report = validate_decimation(args.wav_path, args.bpm, args.beat_division,
+                                     target_rate=args.decimate or DEFAULT_DECIMATION_RATE,
+                                     threshold_vals=parse_min_max(args.min_max))
+        print(json.dumps(report, indent=4), file=stdout)
+        return
 
-    beat_schema.validate_unique_shift_events()
-    beat_schema.remove_redundant_shift_events()
-    beat_schema.scale_minmax(args.no_round)
-    beat_schema.add_alignment_event()
-    if args.as_leveldata:
-        beat_schema.write_to_leveldata(args.output)
-    else:
-        beat_schema.write_to_json(args.output)
+    summary = process_track(
+        args.wav_path,
+        args.bpm,
+        args.output,
+        beat_division=args.beat_division,
+        smoothing_window=args.smoothing_window,
+        min_max=args.min_max,
+        rounding=args.no_round,
+        as_leveldata=args.as_leveldata,
+        stream=args.stream,
+        cache=cache,
+        compresslevel=args.compresslevel,
+        compact=args.compact,
+        trace_memory=args.export_stats,
+        profile=args.profile is not None,
+        per_channel=args.per_channel,
+        stems=args.stems,
+        workers=args.workers,
+        target_rate=args.decimate,
+        engine=args.engine,
+        simplify=args.simplify)
+    # Keep stdout pure JSON when the profile goes there
+    info = stderr if args.profile == "-" else stdout
+    if summary["bpm_confidence"] is not None:
+        print(f"Estimated BPM: {summary['bpm']} (confidence {summary['bpm_confidence']:.2f})", file=info)
+    for export in summary["exports"]:
+        if "simplify" in export:
+            simplified = export["simplify"]
+            print(f"Simplified {simplified['events_before']} -> {simplified['events_after']} events "
+                  f"({simplified['removed'] / max(1, simplified['events_before']):.0%} fewer, max error {simplified['max_error']:.3f}), "
+                  f"{simplified['bytes_before'] / 1024:.1f} KB -> {export['bytes'] / 1024:.1f} KB", file=info)
+        if not args.export_stats:
+            continue
+        print(f"Exported {export['events']} events to {export['filename']}: {export['bytes'] / 1024:.1f} KB "
+              f"in {export['seconds']:.3f}s, peak memory {export['peak_memory_bytes'] / 1024 / 1024:.1f} MB", file=info)
+    if args.profile is not None:
+        profiling.write_report(summary["profile"], args.profile, stdout=stdout)
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    check_args(parser, args)
+    run(args)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,227 @@
+"""
+Incremental analysis for live and preview use: segments and shift events are
+yielded as audio blocks arrive instead of after the whole track is analyzed.
+
+    python preview.py song.wav 128
+    arecord -f S16_LE -r 48000 -c 2 -t wav | python preview.py - 128 --warmup-beats 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+import numpy as np
+
+from bass_bouncer import (THRESHOLD_PERCENTILES, calculate_thresholds, energies_from_bands,
+                          segment_band_energies, segment_length, threshold_sketch)
+from beatschema import BeatSchema
+from main import parse_min_max
+from wav_stream import iter_wav_blocks, open_wav, read_wav_header
+
+def iter_mono_blocks(source, samples_per_block, rate=None):
+    """
+    Yields (rate, mono samples) blocks from a WAV path, a binary file object such as
+    stdin, or an iterable of sample arrays (e.g. a live capture buffer, needs rate).
+    samples_per_block(rate) gives the block size for WAV input, iterables keep
+    whatever block sizes they produce.
+    """
+    if isinstance(source, (str, os.PathLike)) or hasattr(source, "read"):
+        with open_wav(source) as fid:
+            header = read_wav_header(fid)
+            rate = header["rate"]
+            for data in iter_wav_blocks(fid, header, samples_per_block(rate)):
+                yield rate, np.mean(data, axis=1) if data.ndim > 1 else data
+    else:
+        if rate is None:
+            raise ValueError("rate is required when streaming raw sample blocks")
+        for data in source:
+            data = np.asarray(data)
+            yield rate, np.mean(data, axis=1) if data.ndim > 1 else data
+
+def iter_bass_segments(source, bpm=160, beat_division=4, rate=None, block_segments=None,
+                       smoothing_window=3, threshold_vals=('low', 'high'), smoothing_algo='none',
+                       transient_focus=0.7, warmup_segments=0, thresholds=None):
+    """
+    Incremental generate_bass_data: yields segment dicts (shaped like its 'segments'
+    entries) while the audio is still being read.
+
+    The full-track percentiles aren't known up front, so normalization uses, in order
+    of precedence: fixed thresholds (e.g. from an earlier full analysis), thresholds
+    frozen after the first warmup_segments segments, or running thresholds over all
+    segments seen so far. Running thresholds come from a QuantileSketch, so a live
+    session of any length needs constant memory for them.
+
+    Args:
+        source: WAV path, binary file object / pipe, or iterable of sample arrays
+        rate: Sample rate of raw sample blocks, unused for WAV input
+        block_segments: Segments analyzed per block (default: one beat)
+        smoothing_algo: 'none' or 'convolution' (delays output by half a window)
+        warmup_segments: Hold output until this many segments are in, then freeze thresholds
+        thresholds: Fixed thresholds dict as returned by calculate_thresholds
+    """
+    if smoothing_algo not in ('none', 'convolution'):
+        raise ValueError(f"Smoothing algorithm {smoothing_algo!r} needs the whole track, use 'none' or 'convolution'")
+    if block_segments is None:
+        block_segments = beat_division
+    window = smoothing_window if smoothing_algo == 'convolution' else 1
+    kernel = np.ones(window) / window
+    lower_bound, upper_bound = threshold_vals
+
+    state = {"sps": None, "rate": None, "beat_duration": None}
+    seen_bass = threshold_sketch()  # bass energies of every analyzed segment
+    # Zero padding in front reproduces np.convolve(mode='same') at the start of the track
+    smoothing_input = np.zeros(window // 2)
+    history = np.zeros(2)  # last two bass energies, for the transient of the next segment
+    waiting = []  # (bass_energy, smoothed_energy) arrays smoothed but held back by warm-up
+    unsmoothed_bass = np.empty(0)
+    n_analyzed = n_emitted = 0
+
+    def analyze(bands):
+        # Adds the band energies of new segments, queueing the ones that can be smoothed already
+        nonlocal history, smoothing_input, unsmoothed_bass, n_analyzed
+        bass_energies, _ = energies_from_bands(bands)
+        extended = np.concatenate([history, bass_energies])
+        transient_energies = np.maximum(0, extended[1:-1] - extended[:-2])
+        transient_energies[:max(0, 2 - n_analyzed)] = 0  # the first two segments have no transient
+        history = extended[-2:]
+        seen_bass.update(bass_energies)
+        n_analyzed += len(bands)
+
+        combined_energy = (1 - transient_focus) * bass_energies + transient_focus * transient_energies
+        unsmoothed_bass = np.concatenate([unsmoothed_bass, bass_energies])
+        if smoothing_algo == 'none':
+            smoothing_input = np.concatenate([smoothing_input, bass_energies])
+        else:
+            smoothing_input = np.concatenate([smoothing_input, combined_energy])
+        smooth_ready()
+
+    def smooth_ready():
+        nonlocal smoothing_input, unsmoothed_bass
+        n_ready = len(smoothing_input) - window + 1
+        if n_ready <= 0:
+            return
+        smoothed = np.convolve(smoothing_input, kernel, mode='valid') if window > 1 else smoothing_input.copy()
+        waiting.append((unsmoothed_bass[:n_ready], smoothed[:n_ready]))
+        smoothing_input = smoothing_input[n_ready:]
+        unsmoothed_bass = unsmoothed_bass[n_ready:]
+
+    def emit(final=False):
+        nonlocal thresholds, n_emitted
+        if thresholds is None and warmup_segments:
+            if n_analyzed < warmup_segments and not final:
+                return
+            thresholds = calculate_thresholds(seen_bass)
+        if thresholds is not None:
+            lower, upper = thresholds[lower_bound], thresholds[upper_bound]
+        else:
+            # Running thresholds only need the two bounds in use
+            lower, upper = seen_bass.percentile([THRESHOLD_PERCENTILES[lower_bound],
+                                                 THRESHOLD_PERCENTILES[upper_bound]])
+
+        for bass_energies, smoothed_energies in waiting:
+            if upper > lower:
+                normalized_values = (np.clip(smoothed_energies, lower, upper) - lower) / (upper - lower)
+            else:
+                normalized_values = np.zeros(len(smoothed_energies))  # not enough spread yet
+            time_seconds = (n_emitted + np.arange(len(bass_energies))) * state["sps"] / state["rate"]
+            beat_numbers = time_seconds / state["beat_duration"]
+            for segment in zip(time_seconds.tolist(), beat_numbers.tolist(), bass_energies.tolist(),
+                               smoothed_energies.tolist(), normalized_values.tolist()):
+                n_emitted += 1
+                yield {
+                    'time_seconds': segment[0],
+                    'beat': segment[1],
+                    'beat_fraction': segment[1] % 1,
+                    'raw_energy': segment[2],
+                    'smoothed_energy': segment[3],
+                    'normalized_value': segment[4]
+                }
+        waiting.clear()
+
+    def samples_per_block(block_rate):
+        return block_segments * segment_length(block_rate, bpm, beat_division)[1]
+
+    pending = np.empty(0)
+    for block_rate, data in iter_mono_blocks(source, samples_per_block, rate):
+        if state["sps"] is None:
+            state["rate"] = block_rate
+            state["beat_duration"], state["sps"] = segment_length(block_rate, bpm, beat_division)
+        sps = state["sps"]
+        pending = np.concatenate([pending, data]) if len(pending) else data
+        n_whole = len(pending) // sps * sps
+        if n_whole:
+            analyze(segment_band_energies(pending[:n_whole], sps, block_rate))
+            pending = pending[n_whole:]
+            yield from emit()
+
+    if state["sps"] is None:
+        return
+    # Trailing partial segment, kept under the same rule as segment_band_energies
+    if len(pending):
+        bands = segment_band_energies(pending, state["sps"], state["rate"])
+        if len(bands):
+            analyze(bands)
+    # np.convolve(mode='same') pads the end with zeros too
+    smoothing_input = np.concatenate([smoothing_input, np.zeros((window - 1) // 2)])
+    smooth_ready()
+    if n_analyzed:
+        yield from emit(final=True)
+
+def iter_shift_events(segments, rounding=1, ease=-1):
+    """
+    Turns a stream of segment dicts into editor shift event entities as they become
+    final. Like BeatSchema's dedup only the last event of a run of equal values is
+    kept, so each event is yielded once the value changes. Values aren't min-max
+    rescaled over the track as in the full export, they are already in 0-1.
+    """
+    previous = None
+    started = False
+    for segment in segments:
+        event = (segment['beat'], round(segment['normalized_value'], rounding))
+        if previous is not None and previous[1] != event[1]:
+            if not started and previous[0] != 0:
+                yield BeatSchema._shift_event_entity(0, 0, ease)  # alignment event
+            started = True
+            yield BeatSchema._shift_event_entity(previous[0], previous[1], ease)
+        previous = event
+    if previous is not None:
+        if not started and previous[0] != 0:
+            yield BeatSchema._shift_event_entity(0, 0, ease)
+        yield BeatSchema._shift_event_entity(previous[0], previous[1], ease)
+
+async def aiter_bass_segments(*args, **kwargs):
+    """Async iterator version of iter_bass_segments, reading and analyzing in a worker thread"""
+    segments = iter_bass_segments(*args, **kwargs)
+    done = object()
+    while (segment := await asyncio.to_thread(next, segments, done)) is not done:
+        yield segment
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wav_path", type=str, help="Path to the WAV file, or - to read a WAV stream from stdin")
+    parser.add_argument("bpm", type=float, help="Beats per minute")
+    parser.add_argument("--beat_division", type=int, default=4, help="Number of segments per beat (default: 4)")
+    parser.add_argument("--min-max", type=str, default="min,max", help="Bounds to normalize between (default: min,max). Valid values: min, low, mid, high, max")
+    parser.add_argument("--warmup-beats", type=float, default=0, help="Beats to collect before freezing thresholds (default: 0, running thresholds)")
+    parser.add_argument("--segments", action="store_true", default=False, help="Print segment dicts instead of shift events")
+    args = parser.parse_args()
+    try:
+        threshold_vals = parse_min_max(args.min_max)
+    except ValueError as e:
+        parser.error(str(e))
+
+    source = sys.stdin.buffer if args.wav_path == "-" else args.wav_path
+    segments = iter_bass_segments(
+        source,
+        bpm=args.bpm,
+        beat_division=args.beat_division,
+        threshold_vals=threshold_vals,
+        transient_focus=0.9,
+        warmup_segments=int(args.warmup_beats * args.beat_division))
+    # One JSON object per line, flushed so a consumer sees each one as soon as it's final
+    for item in segments if args.segments else iter_shift_events(segments):
+        print(json.dumps(item), flush=True)
+
+if __name__ == "__main__":
+    main()
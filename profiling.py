@@ -0,0 +1,193 @@
+import contextvars
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+class _NullCounts(dict):
+    """Counts dict handed out while profiling is off, writes to it are dropped"""
+    def __setitem__(self, key, value):
+        pass
+
+    def update(self, *args, **kwargs):
+        pass
+
+# Shared and reusable, so a disabled stage costs one lookup and no allocations
+_NULL_STAGE = nullcontext(_NullCounts())
+# Profiler of the running profile(). A context variable, so concurrent jobs in
+# different threads (the analysis server) each record into their own
+_active = contextvars.ContextVar("active_profiler", default=None)
+# Users of tracing() and whether it started tracemalloc
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_started_tracing = False
+
+class Profiler:
+    """
+    Records wall time, CPU time and peak traced allocations of named pipeline stages.
+    Stages nest: a stage opened inside another is recorded with a "parent/child" path
+    and its time also counts towards the parent. Stages opened in worker threads are
+    nested per thread; their peak memory is approximate since tracemalloc's peak is
+    process wide.
+    """
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = []
+        self._records = {}  # path -> record, so stages run in a loop add up into one record
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def _open(self):
+        """Stages currently running in this thread, outermost first, as [record, peak] pairs"""
+        try:
+            return self._local.open
+        except AttributeError:
+            self._local.open = []
+            return self._local.open
+
+    @contextmanager
+    def stage(self, name, **counts):
+        """
+        Times the body as one stage. Yields a dict of numeric counts (segments, events,
+        bytes, ...) the body can add to once it knows them. Entering the same stage path
+        again adds its times and counts to the existing record and bumps its "calls".
+        """
+        open_stages = self._open
+        path = f"{open_stages[-1][0]['path']}/{name}" if open_stages else name
+        with self._lock:
+            record = self._records.get(path)
+            if record is None:
+                record = self._records[path] = {"name": name, "path": path, "calls": 0,
+                                                "wall_seconds": 0.0, "cpu_seconds": 0.0}
+                self.stages.append(record)
+            record["calls"] += 1
+        start_memory = 0
+        if self.trace_memory:
+            start_memory, peak = tracemalloc.get_traced_memory()
+            for parent in open_stages:
+                parent[1] = max(parent[1], peak)
+            tracemalloc.reset_peak()
+        entry = [record, start_memory]
+        open_stages.append(entry)
+
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield counts
+        finally:
+            wall_seconds, cpu_seconds = time.perf_counter() - start_wall, time.process_time() - start_cpu
+            open_stages.pop()
+            if self.trace_memory:
+                peak = max(entry[1], tracemalloc.get_traced_memory()[1])
+                if open_stages:
+                    open_stages[-1][1] = max(open_stages[-1][1], peak)
+            with self._lock:
+                record["wall_seconds"] += wall_seconds
+                record["cpu_seconds"] += cpu_seconds
+                for key, value in counts.items():
+                    record[key] = record.get(key, 0) + value
+                if self.trace_memory:
+                    record["peak_memory_bytes"] = max(record.get("peak_memory_bytes", 0), peak - start_memory)
+
+    def report(self, **meta):
+        """JSON-ready dict of every recorded stage, plus any metadata passed in"""
+        return {**meta, "stages": [dict(record) for record in self.stages]}
+
+@contextmanager
+def profile(trace_memory=True):
+    """
+    Turns profiling on for the body and yields the Profiler collecting the stages:
+
+        with profiling.profile() as profiler:
+            process_track(...)
+        print(json.dumps(profiler.report()))
+    """
+    profiler = Profiler(trace_memory)
+    with tracing() if trace_memory else nullcontext():
+        token = _active.set(profiler)
+        try:
+            yield profiler
+        finally:
+            _active.reset(token)
+
+@contextmanager
+def tracing():
+    """
+    Keeps tracemalloc running for the body. It is process wide, so it is started by
+    the first of any overlapping users (profiles, export stats, concurrent server
+    jobs) and stopped when the last one ends, unless it was already running.
+    """
+    global _tracing_users, _started_tracing
+    with _tracing_lock:
+        if not _tracing_users and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _tracing_users += 1
+    try:
+        yield
+    finally:
+        with _tracing_lock:
+            _tracing_users -= 1
+            if not _tracing_users and _started_tracing:
+                tracemalloc.stop()
+                _started_tracing = False
+
+def run_in_context(function):
+    """
+    Wraps function to run in a copy of the calling thread's context, so stages it
+    opens in pool threads are recorded by the caller's active profile
+    """
+    context = contextvars.copy_context()
+    return lambda *args: context.copy().run(function, *args)
+
+def stage(name, **counts):
+    """
+    Instrumentation point used throughout the pipeline:
+
+        with profiling.stage("fft", samples=n) as counts:
+            ...
+            counts["segments"] = len(bands)
+
+    A no-op context when no profile() is active.
+    """
+    profiler = _active.get()
+    if profiler is None:
+        return _NULL_STAGE
+    return profiler.stage(name, **counts)
+
+def aggregate(reports):
+    """
+    Sums stage times across several reports (e.g. one per batch track) by stage path.
+    Peak memory is the largest seen, counts are summed.
+    """
+    totals = {}
+    for report in reports:
+        for record in report["stages"]:
+            total = totals.setdefault(record["path"], {"path": record["path"]})
+            for key, value in record.items():
+                if key in ("name", "path") or not isinstance(value, (int, float)):
+                    continue
+                if key == "peak_memory_bytes":
+                    total[key] = max(total.get(key, 0), value)
+                else:
+                    total[key] = total.get(key, 0) + value
+    return list(totals.values())
+
+def format_stages(stages):
+    """Human readable table of stage records or aggregate() totals"""
+    lines = [f"{'stage':<36} {'calls':>6} {'wall':>9} {'cpu':>9} {'peak mem':>10}"]
+    for record in stages:
+        peak = record.get("peak_memory_bytes")
+        peak = f"{peak / 1024 / 1024:8.1f}MB" if peak is not None else f"{'-':>10}"
+        lines.append(f"{record['path']:<36} {record['calls']:>6} {record['wall_seconds']:8.3f}s "
+                     f"{record['cpu_seconds']:8.3f}s {peak}")
+    return "\n".join(lines)
+
+def write_report(report, destination, stdout=None):
+    """Writes a report as JSON to a path, or to stdout (or the given stream) for "-" """
+    if destination == "-":
+        print(json.dumps(report, indent=4), file=stdout)
+    else:
+        with open(destination, "w") as f:
+            json.dump(report, f, indent=4)
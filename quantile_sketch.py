@@ -0,0 +1,140 @@
+import numpy as np
+
+# Values kept as they are before a sketch starts compressing, below this it is exact
+DEFAULT_EXACT_LIMIT = 1 << 16
+# t-digest compression: a compressed sketch keeps about half this many centroids
+DEFAULT_COMPRESSION = 500
+
+class QuantileSketch:
+    """
+    Mergeable streaming quantile sketch in the style of a merging t-digest.
+
+    Values are added chunk by chunk with update(); sketches of different chunks,
+    tracks or whole albums combine with merge() or QuantileSketch.merged(). Until
+    more than exact_limit values are in, the raw values are kept and percentile()
+    equals np.percentile. After that they are compressed into weighted centroids,
+    small near both ends so the extreme percentiles stay accurate, and memory stays
+    at a few hundred centroids however many values are added. exact=True
+    never compresses, and only merges sketches that haven't either.
+    """
+    def __init__(self, compression=DEFAULT_COMPRESSION, exact_limit=DEFAULT_EXACT_LIMIT, exact=False):
+        self.compression = compression
+        self.exact_limit = exact_limit
+        self.exact = exact
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self._values = []  # uncompressed chunks
+        self._n_values = 0
+        self._means = None  # centroids once compressed, sorted by mean
+        self._weights = None
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def is_exact(self):
+        """True while no values have been compressed, so percentiles are exact"""
+        return self._means is None
+
+    def update(self, values):
+        """Adds a chunk of values"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not len(values):
+            return self
+        self.count += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._values.append(values)
+        self._n_values += len(values)
+        self._maybe_compress()
+        return self
+
+    def merge(self, other):
+        """Adds everything another sketch has seen, in place"""
+        if not other.count:
+            return self
+        if self.exact and not other.is_exact:
+            raise ValueError("Can't merge a compressed sketch into an exact one, its values are gone")
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._values.extend(other._values)
+        self._n_values += other._n_values
+        if other._means is not None:
+            # Joined centroid arrays aren't sorted any more, percentile() needs them sorted
+            self._add_centroids(other._means, other._weights)
+            self._compress()
+        else:
+            self._maybe_compress()
+        return self
+
+    @classmethod
+    def merged(cls, sketches, **kwargs):
+        """One sketch of everything the given sketches have seen"""
+        result = cls(**kwargs)
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+    def _maybe_compress(self):
+        # Raw values are buffered up to exact_limit, merged centroids up to a few times compression
+        if self.exact:
+            return
+        if self._n_values > self.exact_limit or (self._means is not None and len(self._means) > 4 * self.compression):
+            self._compress()
+
+    def _add_centroids(self, means, weights):
+        if self._means is None:
+            self._means, self._weights = means, weights
+        else:
+            self._means = np.concatenate([self._means, means])
+            self._weights = np.concatenate([self._weights, weights])
+
+    def _compress(self):
+        """Folds the raw values into the centroids and merges neighbours by the k1 scale function"""
+        if self._values:
+            values = np.concatenate(self._values)
+            self._add_centroids(values, np.ones(len(values)))
+            self._values, self._n_values = [], 0
+        order = np.argsort(self._means, kind="stable")
+        means, weights = self._means[order], self._weights[order]
+        cumulative = np.cumsum(weights)
+        total = cumulative[-1]
+        # k1(q) = compression / (2 pi) * asin(2q - 1): each unit of k is one centroid,
+        # so centroids get small where q is close to 0 or 1
+        q_mid = (cumulative - weights / 2) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q_mid - 1)
+        group = np.floor(k)
+        starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+        if len(starts) == len(means):
+            self._means, self._weights = means, weights
+            return
+        self._weights = np.add.reduceat(weights, starts)
+        self._means = np.add.reduceat(means * weights, starts) / self._weights
+
+    def percentile(self, q):
+        """
+        Percentiles (0-100, scalar or sequence) of everything added, interpolated like
+        np.percentile's default linear method. Exact while is_exact.
+        """
+        if not self.count:
+            raise ValueError("Percentile of an empty sketch")
+        if self.is_exact:
+            if len(self._values) > 1:
+                self._values = [np.concatenate(self._values)]
+            return np.percentile(self._values[0], q)
+        if self._values:
+            self._compress()
+
+        # Centroid i stands for ranks cumulative_before_i .. cumulative_before_i + w_i - 1,
+        # interpolate at the middle of that range, with the exact min and max at the ends
+        before = np.cumsum(self._weights) - self._weights
+        positions = np.r_[0, before + (self._weights - 1) / 2, self.count - 1]
+        means = np.r_[self.min, self._means, self.max]
+        rank = np.asarray(q, dtype=np.float64) / 100 * (self.count - 1)
+        return np.interp(rank, positions, means)
+
+    def quantile(self, q):
+        """Quantiles (0-1) of everything added, see percentile"""
+        return self.percentile(np.asarray(q, dtype=np.float64) * 100)
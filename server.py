@@ -0,0 +1,159 @@
+"""
+Long-running analysis daemon: keeps numpy/scipy imported and recently decoded
+audio and band energies in memory, so repeat jobs skip startup, decode and FFT.
+
+    python server.py --workers 2                  # http://127.0.0.1:8765
+    python server.py --socket /tmp/bouncer.sock   # Unix socket instead of TCP
+    python client.py song.wav 128 --output song.json
+
+Jobs take exactly main.py's arguments (client.py sends them parsed) and run on a
+bounded thread pool. Endpoints: POST /analyze with {"args": {...}}, GET /status.
+Every --profile job records its own stages, but jobs running at the same time
+share the process, so their CPU time and peak memory numbers can include work
+of the other jobs.
+"""
+import argparse
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from analysis_cache import AnalysisCache, MemoryAnalysisCache, MemoryLRU
+import main as cli
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+class AnalysisService:
+    """Runs parsed main.py arguments on a worker pool, sharing the in-memory caches"""
+    def __init__(self, workers=None, audio_cache_bytes=1024 * 1024 * 1024, band_cache_bytes=256 * 1024 * 1024):
+        import bass_bouncer
+        import beatschema  # noqa: F401, imported now so the first job doesn't pay for it
+        import scipy.io.wavfile  # noqa: F401
+        import scipy.signal  # noqa: F401
+
+        bass_bouncer.decoded_audio = self.decoded_audio = MemoryLRU(audio_cache_bytes)
+        self.band_cache_bytes = band_cache_bytes
+        self.band_caches = {}  # on-disk cache dir (or None) -> MemoryAnalysisCache in front of it
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers)
+        self.started = time.time()
+        self.jobs = 0
+        self._lock = threading.Lock()
+
+    def band_cache(self, args):
+        # Jobs asking for --cache get the memory cache written through to that directory
+        with self._lock:
+            cache = self.band_caches.get(args.cache)
+            if cache is None:
+                backend = AnalysisCache(args.cache, args.cache_size * 1024 * 1024) if args.cache else None
+                cache = self.band_caches[args.cache] = MemoryAnalysisCache(self.band_cache_bytes, backend)
+            return cache
+
+    def _run(self, args):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        start = time.perf_counter()
+        cli.run(args, cache=self.band_cache(args), stdout=stdout, stderr=stderr)
+        return {"stdout": stdout.getvalue(), "stderr": stderr.getvalue(), "seconds": time.perf_counter() - start}
+
+    def analyze(self, arguments):
+        """Runs one job, given main.py's parsed arguments as a dict; blocks until it's done"""
+        with self._lock:
+            self.jobs += 1
+        return self.pool.submit(self._run, argparse.Namespace(**arguments)).result()
+
+    def status(self):
+        return {
+            "pid": os.getpid(),
+            "uptime_seconds": time.time() - self.started,
+            "workers": self.workers,
+            "jobs": self.jobs,
+            "decoded_audio": self.decoded_audio.stats(),
+            "band_energies": {str(directory): cache.lru.stats() for directory, cache in self.band_caches.items()},
+        }
+
+class RequestHandler(BaseHTTPRequestHandler):
+    server_version = "HorizonBouncer"
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/status":
+            self._reply(200, self.server.service.status())
+        else:
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/analyze":
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            result = self.server.service.analyze(request["args"])
+        except Exception as e:
+            # A failed job is reported to its client, the server keeps running
+            self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._reply(200, result)
+
+    def address_string(self):
+        # Unix socket peers have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, verbose=False):
+    """HTTP server for service on host:port, or on a Unix socket when socket_path is given"""
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # left over from a server that didn't shut down cleanly
+        server = UnixHTTPServer(socket_path, RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.service = service
+    server.verbose = verbose
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", type=str, default=DEFAULT_HOST, help=f"Address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"TCP port (default: {DEFAULT_PORT})")
+    parser.add_argument("--socket", type=str, default=None, metavar="PATH", help="Listen on a Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=None, help="Jobs analyzed at the same time (default: CPU count, up to 4)")
+    parser.add_argument("--audio-cache-size", type=int, default=1024, help="MB of decoded audio kept in memory (default: 1024)")
+    parser.add_argument("--band-cache-size", type=int, default=256, help="MB of band energies kept in memory (default: 256)")
+    parser.add_argument("--verbose", action="store_true", default=False, help="Log every request")
+    args = parser.parse_args()
+
+    service = AnalysisService(args.workers, args.audio_cache_size * 1024 * 1024, args.band_cache_size * 1024 * 1024)
+    server = make_server(service, args.host, args.port, args.socket, args.verbose)
+    where = args.socket or f"http://{args.host}:{args.port}"
+    print(f"Analysis server listening on {where} with {service.workers} workers", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.pool.shutdown()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+if __name__ == "__main__":
+    main()
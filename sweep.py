@@ -0,0 +1,164 @@
+"""
+Parameter sweep: charts every combination of transient focus, smoothing algorithm,
+smoothing window and bounds from a single band energy analysis.
+
+    python sweep.py song.wav 128 --transient-focus 0.5 0.7 0.9 --smoothing none convolution \
+        --smoothing-window 3 5 9 --bounds min,max low,high --output-dir sweep
+
+One chart per combination goes to --output-dir (or none with --stats-only), and a
+table of event counts and value distributions is printed to pick settings from.
+The defaults are main.py's fixed settings, so a sweep without grid arguments
+writes the same chart as main.py.
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from analysis_cache import AnalysisCache, DEFAULT_CACHE_DIR
+from constants import ANALYSIS_ENGINES, DEFAULT_DECIMATION_RATE, SMOOTHING_ALGOS
+from main import build_beat_schema, check_decimation_rate, parse_bpm, parse_min_max
+
+def chart_path(wav_path, output_dir, combination, as_leveldata):
+    """song.wav -> output_dir/song_convolution_w5_f0.7_min-max.json"""
+    low, high = combination["threshold_vals"]
+    name = (f"{Path(wav_path).stem}_{combination['smoothing_algo']}_w{combination['smoothing_window']}"
+            f"_f{combination['transient_focus']:g}_{low}-{high}")
+    return str(Path(output_dir) / (f"{name}.LevelData" if as_leveldata else f"{name}.json"))
+
+def value_stats(values):
+    """Distribution of every row of a (combinations, segments) array of normalized values"""
+    import numpy as np
+
+    p5, p50, p95 = np.percentile(values, [5, 50, 95], axis=1)
+    return {
+        "mean": values.mean(axis=1),
+        "std": values.std(axis=1),
+        "p5": p5,
+        "p50": p50,
+        "p95": p95,
+        # Time spent pinned to the bounds, high means the bounds are too tight
+        "at_floor": np.mean(values <= 0, axis=1),
+        "at_ceiling": np.mean(values >= 1, axis=1),
+        # Shift events before rounding and scaling
+        "changes": 1 + np.count_nonzero(np.diff(values, axis=1), axis=1),
+    }
+
+def sweep_track(wav_path, bpm, output_dir=None, beat_division=4, transient_focus=(0.9,), smoothing_algos=("none",),
+                smoothing_windows=(5,), bounds=("min,max",), rounding=True, as_leveldata=False, stream=False,
+                cache=None, target_rate=None, engine="fft"):
+    """
+    Analyzes wav_path once and charts every parameter combination (see
+    bass_bouncer.sweep_bass_data). bpm can be "auto". Charts are written to
+    output_dir, or only summarized when it is None.
+
+    Returns:
+        dict: bpm used, BPM confidence (None unless estimated), thresholds, analysis
+              and sweep seconds, and per combination its parameters, value stats,
+              and with charts the output file and event count
+    """
+    from bass_bouncer import calculate_band_energies, estimate_bpm, sweep_bass_data
+
+    bpm_confidence = None
+    start = time.perf_counter()
+    if bpm == "auto":
+        bpm, bpm_confidence = estimate_bpm(wav_path, stream=stream, cache=cache, target_rate=target_rate, engine=engine)
+    rate, beat_duration, samples_per_segment, bands = calculate_band_energies(
+        wav_path, bpm=bpm, beat_division=beat_division, stream=stream, cache=cache, target_rate=target_rate,
+        engine=engine)
+    analysis_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sweep = sweep_bass_data(
+        bands, rate, beat_duration, samples_per_segment, beat_division=beat_division,
+        transient_focus=transient_focus, smoothing_algos=smoothing_algos, smoothing_windows=smoothing_windows,
+        threshold_vals=[parse_min_max(pair) for pair in bounds])
+    stats = value_stats(sweep["normalized_values"])
+    sweep_seconds = time.perf_counter() - start
+
+    results = []
+    for i, combination in enumerate(sweep["combinations"]):
+        result = dict(combination, threshold_vals=",".join(combination["threshold_vals"]))
+        result.update({key: float(values[i]) for key, values in stats.items()})
+        result["changes"] = int(stats["changes"][i])
+        if output_dir is not None:
+            beat_schema = build_beat_schema(sweep["beats"], sweep["normalized_values"][i], bpm, rounding=rounding)
+            output = chart_path(wav_path, output_dir, combination, as_leveldata)
+            export = beat_schema.write_to_leveldata(output) if as_leveldata else beat_schema.write_to_json(output)
+            result.update(output=output, events=export["events"])
+        results.append(result)
+
+    return {
+        "bpm": bpm,
+        "bpm_confidence": bpm_confidence,
+        "thresholds": {key: float(value) for key, value in sweep["thresholds"].items()},
+        "analysis_seconds": analysis_seconds,
+        "sweep_seconds": sweep_seconds,
+        "results": results,
+    }
+
+def print_table(results):
+    print(f"{'smoothing':<17}  {'window':>6}  {'focus':>5}  {'bounds':<9}  {'events':>6}  {'mean':>5}  {'p5':>5}  "
+          f"{'p50':>5}  {'p95':>5}  {'floor':>6}  {'ceiling':>7}")
+    for result in results:
+        events = result.get("events", result["changes"])
+        print(f"{result['smoothing_algo']:<17}  {result['smoothing_window']:>6}  {result['transient_focus']:>5g}  "
+              f"{result['threshold_vals']:<9}  {events:>6}  {result['mean']:5.2f}  {result['p5']:5.2f}  "
+              f"{result['p50']:5.2f}  {result['p95']:5.2f}  {result['at_floor']:6.1%}  {result['at_ceiling']:7.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wav_path", type=str, help="Path to the WAV file")
+    parser.add_argument("bpm", type=parse_bpm, help="Beats per minute, or 'auto' to estimate it from the bass onsets")
+    parser.add_argument("--beat_division", type=int, default=4, help="Number of segments per beat (default: 4)")
+    parser.add_argument("--transient-focus", type=float, nargs="+", default=[0.9], metavar="FOCUS", help="Transient emphasis values, 0-1 (default: 0.9)")
+    parser.add_argument("--smoothing", choices=SMOOTHING_ALGOS, nargs="+", default=["none"], help="Smoothing algorithms (default: none)")
+    parser.add_argument("--smoothing-window", type=int, nargs="+", default=[5], metavar="WINDOW", help="Smoothing window sizes (default: 5)")
+    parser.add_argument("--bounds", type=str, nargs="+", default=["min,max"], metavar="LOW,HIGH", help="Bounds pairs, e.g. min,max low,high (default: min,max)")
+    parser.add_argument("--no-round", action="store_false", default=True, help="Disable rounding of minmaxed values (default: True)")
+    parser.add_argument("--as-leveldata", action="store_true", default=False, help="Output as LevelData (default: False)")
+    parser.add_argument("--stream", action="store_true", default=False, help="Read the WAV in blocks to keep memory constant on long tracks (default: False)")
+    parser.add_argument("--cache", nargs="?", const=str(DEFAULT_CACHE_DIR), default=None, help=f"Cache band energies on disk so reruns skip decoding and FFT (default dir: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--cache-size", type=int, default=512, help="Maximum cache size in MB before least recently used entries are evicted (default: 512)")
+    parser.add_argument("--decimate", nargs="?", type=int, const=DEFAULT_DECIMATION_RATE, default=None, metavar="RATE", help=f"Low-pass and decimate to about RATE Hz before the FFTs (default rate: {DEFAULT_DECIMATION_RATE})")
+    parser.add_argument("--engine", choices=ANALYSIS_ENGINES, default="fft", help="Band energy engine (default: fft)")
+    parser.add_argument("--output-dir", type=str, default="sweep", help="Directory for the per-combination charts (default: sweep)")
+    parser.add_argument("--stats-only", action="store_true", default=False, help="Only print the stats, don't write charts")
+    parser.add_argument("--summary", type=str, default=None, help="Also write the parameters and stats of every combination as JSON to this path")
+    args = parser.parse_args()
+
+    for pair in args.bounds:
+        try:
+            parse_min_max(pair)
+        except ValueError as e:
+            parser.error(str(e))
+    if any(window < 1 for window in args.smoothing_window):
+        parser.error("Smoothing windows must be at least 1")
+    try:
+        check_decimation_rate(args.decimate)
+    except ValueError as e:
+        parser.error(str(e))
+
+    output_dir = None
+    if not args.stats_only:
+        output_dir = args.output_dir
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+    cache = AnalysisCache(args.cache, args.cache_size * 1024 * 1024) if args.cache else None
+    summary = sweep_track(
+        args.wav_path, args.bpm, output_dir, beat_division=args.beat_division,
+        transient_focus=args.transient_focus, smoothing_algos=args.smoothing,
+        smoothing_windows=args.smoothing_window, bounds=args.bounds, rounding=args.no_round,
+        as_leveldata=args.as_leveldata, stream=args.stream, cache=cache, target_rate=args.decimate,
+        engine=args.engine)
+
+    if summary["bpm_confidence"] is not None:
+        print(f"Estimated BPM: {summary['bpm']} (confidence {summary['bpm_confidence']:.2f})")
+    print_table(summary["results"])
+    print(f"{len(summary['results'])} combinations from one analysis: analysis {summary['analysis_seconds']:.2f}s, "
+          f"sweep {summary['sweep_seconds']:.3f}s" + ("" if args.stats_only else f", charts in {output_dir}"))
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(summary, f, indent=4)
+
+if __name__ == "__main__":
+    main()
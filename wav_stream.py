@@ -0,0 +1,157 @@
+import struct
+from contextlib import nullcontext
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Some writers (ffmpeg to a pipe, live capture) don't know the data size up front
+UNKNOWN_DATA_SIZES = (0, 0xFFFFFFFF)
+
+def _read_exact(fid, size):
+    """Reads up to size bytes, looping over short reads from pipes"""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = fid.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+def _skip(fid, size):
+    """Skips size bytes, seeking when possible and reading otherwise"""
+    try:
+        fid.seek(size, 1)
+    except (AttributeError, OSError, ValueError):
+        _read_exact(fid, size)
+
+def _sample_dtype(format_tag, bit_depth, bytes_per_sample):
+    """
+    Returns the numpy dtype samples are delivered as, matching scipy.io.wavfile.read.
+    Packed containers (e.g. 24-bit) are widened and left-justified.
+    """
+    if format_tag == WAVE_FORMAT_PCM:
+        if 1 <= bit_depth <= 8:
+            return np.dtype('u1')  # WAV of 8-bit integer or less are unsigned
+        if bytes_per_sample in (3, 5, 6, 7):
+            return np.dtype('<i4') if bytes_per_sample == 3 else np.dtype('<i8')
+        if bytes_per_sample in (2, 4, 8):
+            return np.dtype(f'<i{bytes_per_sample}')
+    elif format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        if bit_depth in (32, 64):
+            return np.dtype(f'<f{bytes_per_sample}')
+    raise ValueError(f"Unsupported WAV format: tag {format_tag:#x}, {bit_depth}-bit")
+
+def read_wav_header(fid):
+    """
+    Parses the RIFF/RF64 header up to the start of the data chunk without touching sample data.
+    Leaves fid positioned at the first sample.
+
+    Returns:
+        dict: rate, channels, bit_depth, format_tag, block_align, dtype,
+              data_size (bytes, None if unknown) and n_frames (None if unknown)
+    """
+    riff = _read_exact(fid, 12)
+    if len(riff) < 12 or riff[8:12] != b"WAVE" or riff[:4] not in (b"RIFF", b"RF64"):
+        raise ValueError("Not a RIFF/WAVE file")
+    is_rf64 = riff[:4] == b"RF64"
+
+    header = {}
+    rf64_data_size = None
+    while True:
+        chunk_header = _read_exact(fid, 8)
+        if len(chunk_header) < 8:
+            raise ValueError("WAV file has no data chunk")
+        chunk_id, chunk_size = chunk_header[:4], struct.unpack("<I", chunk_header[4:])[0]
+
+        if chunk_id == b"ds64":
+            ds64 = _read_exact(fid, chunk_size)
+            rf64_data_size = struct.unpack("<Q", ds64[8:16])[0]
+            _skip(fid, chunk_size % 2)
+        elif chunk_id == b"fmt ":
+            fmt = _read_exact(fid, chunk_size)
+            if len(fmt) < 16:
+                raise ValueError("Binary structure of wave file is not compliant")
+            format_tag, channels, rate, _, block_align, bit_depth = struct.unpack("<HHIIHH", fmt[:16])
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 40:
+                # First two bytes of the sub-format GUID hold the actual format tag
+                format_tag = struct.unpack("<H", fmt[24:26])[0]
+            header.update(
+                rate=rate, channels=channels, bit_depth=bit_depth,
+                format_tag=format_tag, block_align=block_align,
+            )
+            _skip(fid, chunk_size % 2)
+        elif chunk_id == b"data":
+            if not header:
+                raise ValueError("WAV data chunk precedes fmt chunk")
+            if is_rf64 and chunk_size == 0xFFFFFFFF:
+                chunk_size = rf64_data_size
+            data_size = None if chunk_size in UNKNOWN_DATA_SIZES else chunk_size
+            bytes_per_sample = header["block_align"] // header["channels"]
+            header.update(
+                dtype=_sample_dtype(header["format_tag"], header["bit_depth"], bytes_per_sample),
+                data_size=data_size,
+                n_frames=None if data_size is None else data_size // header["block_align"],
+            )
+            return header
+        else:
+            _skip(fid, chunk_size + chunk_size % 2)
+
+def decode_frames(raw, header):
+    """
+    Converts raw little-endian frame bytes into samples shaped like scipy.io.wavfile.read output:
+    (n_frames,) for mono and (n_frames, channels) otherwise
+    """
+    channels = header["channels"]
+    bytes_per_sample = header["block_align"] // channels
+    dtype = header["dtype"]
+    n_samples = len(raw) // bytes_per_sample
+    raw = raw[:n_samples * bytes_per_sample]
+
+    if dtype.itemsize != bytes_per_sample:
+        # Widen packed samples, keeping them left-justified in the larger container
+        packed = np.frombuffer(raw, dtype=np.uint8).reshape(-1, bytes_per_sample)
+        widened = np.zeros((n_samples, dtype.itemsize), dtype=np.uint8)
+        widened[:, -bytes_per_sample:] = packed
+        data = widened.view(dtype).reshape(-1)
+    else:
+        data = np.frombuffer(raw, dtype=dtype)
+
+    if channels > 1:
+        data = data[:len(data) - len(data) % channels].reshape(-1, channels)
+    return data
+
+def iter_wav_blocks(fid, header, block_frames):
+    """
+    Yields consecutive blocks of block_frames frames (the last one may be shorter)
+    from a file positioned at the start of the data chunk. Only one block is held in memory.
+    """
+    block_bytes = block_frames * header["block_align"]
+    remaining = header["data_size"]
+    while remaining is None or remaining > 0:
+        size = block_bytes if remaining is None else min(block_bytes, remaining)
+        raw = _read_exact(fid, size)
+        if remaining is not None:
+            remaining -= len(raw)
+        if len(raw) < header["block_align"]:
+            return
+        yield decode_frames(raw, header)
+        if len(raw) < size:
+            return
+
+def full_scale(dtype):
+    """Largest sample magnitude of a decoded sample dtype: 1.0 for float, 2 ** 31 for left-justified 24-bit"""
+    dtype = np.dtype(dtype)
+    if dtype.kind == "f":
+        return 1.0
+    # Unsigned 8-bit samples are centered on 128, so their swing is the same as a signed byte's
+    return float(2 ** (dtype.itemsize * 8 - 1))
+
+def open_wav(source):
+    """Opens a path for binary reading, or passes an already open binary file object through"""
+    if hasattr(source, "read"):
+        return nullcontext(source)
+    return open(source, "rb")
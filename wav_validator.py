@@ -1,60 +1,204 @@
+"""
+Checks WAV files before analysis. validate_wav_format looks at decoded samples;
+preflight_wav and scan_library only parse the RIFF/fmt/data chunk headers, so a
+whole library is checked without decoding any audio:
+
+    python wav_validator.py library/ "packs/**/*.wav" --workers 16 --json scan.json
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import numpy as np
-import scipy.io.wavfile as wav
+
+from wav_stream import WAVE_FORMAT_IEEE_FLOAT, open_wav, read_wav_header
+
+# Samples looked at to tell left-justified 24-bit data from real 32-bit data
+BIT_DEPTH_PROBE_SAMPLES = 4096
 
 def load_wav_file(file_path):
     """
     loads a WAV file to check for common errors.
-    
+
     Args:
         file_path: The path to the WAV file to load
-    
+
     Returns:
-        tuple: (is_valid, warnings) where is_valid is a boolean and 
+        tuple: (is_valid, warnings) where is_valid is a boolean and
                warnings is a list of warning messages
     """
+    import scipy.io.wavfile as wav  # deferred, scipy.io takes a while to import
+
     rate, data = wav.read(file_path)
     return rate, data
 
-def validate_wav_format(rate, data, expected_rate=48000, expected_bit_depth=24):
+def check_format(rate, bit_depth, is_float=False, expected_rate=48000, expected_bit_depth=24):
     """
-    Validates the sample rate and bit depth of WAV data.
-    
-    Args:
-        rate: The sample rate of the audio file
-        data: The numpy array containing the audio data
-        expected_rate: Expected sample rate in Hz (default: 48000)
-        expected_bit_depth: Expected bit depth (default: 24)
-    
+    Compares a sample rate and bit depth against the expected ones.
+
     Returns:
-        tuple: (is_valid, warnings) where is_valid is a boolean and 
-               warnings is a list of warning messages
+        tuple: (is_valid, warnings) like validate_wav_format
     """
     warnings = []
     is_valid = True
-    
-    # Check sample rate
     if rate != expected_rate:
         warnings.append(f"Expected {expected_rate} Hz sample rate, got {rate} Hz")
         is_valid = False
-    
-    # Determine bit depth from data type
-    if data.dtype == np.int16:
-        bit_depth = 16
-    elif data.dtype == np.int32:
-        bit_depth = 32
-    elif data.dtype == np.int24:  # Uncommon, but possible
-        bit_depth = 24
-    elif data.dtype == np.float32:
-        bit_depth = 32  # Float representation
-        warnings.append("Data is in float32 format rather than integer format")
-    else:
-        bit_depth = None
-        warnings.append(f"Unexpected data type {data.dtype}")
-        is_valid = False
-    
-    # Check bit depth
+    if is_float:
+        warnings.append(f"Data is in float{bit_depth} format rather than integer format")
     if bit_depth != expected_bit_depth and bit_depth is not None:
         warnings.append(f"Expected {expected_bit_depth}-bit audio, got {bit_depth}-bit")
         is_valid = False
-    
-    return is_valid, warnings
\ No newline at end of file
+    return is_valid, warnings
+
+def validate_wav_format(rate, data, expected_rate=48000, expected_bit_depth=24, bit_depth=None):
+    """
+    Validates the sample rate and bit depth of WAV data.
+
+    Args:
+        rate: The sample rate of the audio file
+        data: The numpy array containing the audio data
+        expected_rate: Expected sample rate in Hz (default: 48000)
+        expected_bit_depth: Expected bit depth (default: 24)
+        bit_depth: Bit depth from the file header, if known. Otherwise it is
+                   inferred from data
+
+    Returns:
+        tuple: (is_valid, warnings) where is_valid is a boolean and
+               warnings is a list of warning messages
+    """
+    is_float = data.dtype.kind == "f"
+    if bit_depth is None:
+        if data.dtype == np.int32:
+            # 24-bit samples are delivered left-justified in int32, their low byte is always zero
+            probe = data.reshape(-1)[:BIT_DEPTH_PROBE_SAMPLES]
+            bit_depth = 24 if len(probe) and not np.any(probe & 0xFF) else 32
+        elif data.dtype.kind in "iuf":
+            bit_depth = data.dtype.itemsize * 8
+    if bit_depth is None:
+        _, warnings = check_format(rate, None, False, expected_rate, expected_bit_depth)
+        warnings.append(f"Unexpected data type {data.dtype}")
+        return False, warnings
+    return check_format(rate, bit_depth, is_float, expected_rate, expected_bit_depth)
+
+def preflight_wav(path, expected_rate=48000, expected_bit_depth=24):
+    """
+    Checks a WAV file from its headers alone, without reading any sample data.
+
+    Returns:
+        dict: path, ok (False if the file can't be analyzed), errors, warnings
+              (format differs from the expected one), and from the header rate,
+              channels, bit_depth, format ("pcm" or "float"), n_frames and
+              duration_seconds
+    """
+    report = {"path": str(path), "ok": False, "errors": [], "warnings": []}
+    try:
+        file_size = os.path.getsize(path)
+        with open_wav(path) as fid:
+            header = read_wav_header(fid)
+            data_start = fid.tell()
+    except ZeroDivisionError:
+        report["errors"].append("fmt chunk gives 0 channels or a block align of 0")
+        return report
+    except (OSError, ValueError) as e:
+        # Missing or unreadable files, non-WAV files, unsupported formats
+        report["errors"].append(str(e) if isinstance(e, ValueError) else f"{type(e).__name__}: {e}")
+        return report
+
+    is_float = header["format_tag"] == WAVE_FORMAT_IEEE_FLOAT
+    report.update(
+        rate=header["rate"], channels=header["channels"], bit_depth=header["bit_depth"],
+        format="float" if is_float else "pcm",
+    )
+    errors, warnings = report["errors"], report["warnings"]
+    if not header["rate"]:
+        errors.append("Sample rate is 0")
+    if header["block_align"] < header["channels"] * -(-header["bit_depth"] // 8):
+        errors.append(f"Block align {header['block_align']} is too small for {header['channels']} channels of {header['bit_depth']} bits")
+
+    available = file_size - data_start
+    data_size = header["data_size"]
+    if data_size is None:
+        warnings.append("Data chunk size unknown (streamed WAV), duration taken from the file size")
+        data_size = available
+    elif data_size > available:
+        errors.append(f"Truncated: data chunk holds {data_size} bytes but only {available} follow the header")
+        data_size = available
+    if data_size % header["block_align"]:
+        warnings.append(f"Data size {data_size} isn't a whole number of {header['block_align']}-byte frames")
+    n_frames = data_size // header["block_align"]
+    if not n_frames:
+        errors.append("No audio frames")
+    report.update(n_frames=n_frames, duration_seconds=n_frames / header["rate"] if header["rate"] else 0.0)
+
+    warnings.extend(check_format(header["rate"], header["bit_depth"], is_float, expected_rate, expected_bit_depth)[1])
+    report["ok"] = not errors
+    return report
+
+def collect_wav_paths(sources):
+    """WAV files under directories (recursively), matching glob patterns, or given directly, sorted"""
+    paths = set()
+    for source in sources:
+        if os.path.isdir(source):
+            paths.update(str(p) for p in Path(source).rglob("*") if p.suffix.lower() == ".wav")
+        elif os.path.isfile(source):
+            paths.add(source)
+        else:
+            paths.update(glob.glob(source, recursive=True))
+    return sorted(paths)
+
+def scan_library(paths, workers=None, expected_rate=48000, expected_bit_depth=24):
+    """
+    preflight_wav over many files on a thread pool (header reads are small and
+    mostly wait on the disk), returning the reports in the order of paths
+    """
+    workers = workers or min(32, 4 * (os.cpu_count() or 1))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda path: preflight_wav(path, expected_rate, expected_bit_depth), paths))
+
+def format_report(report):
+    if "rate" not in report:
+        return f"{'error':>7}  {report['path']}  ({'; '.join(report['errors'])})"
+    status = "ok" if report["ok"] and not report["warnings"] else "warning" if report["ok"] else "error"
+    line = (f"{status:>7}  {report['path']}  {report['rate']} Hz, {report['bit_depth']}-bit {report['format']}, "
+            f"{report['channels']} ch, {report['duration_seconds']:.1f}s")
+    problems = report["errors"] + report["warnings"]
+    return line + (f"  ({'; '.join(problems)})" if problems else "")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="+", help="WAV files, directories (searched recursively) or glob patterns")
+    parser.add_argument("--workers", type=int, default=None, help="Files checked at the same time (default: 4x CPU count, up to 32)")
+    parser.add_argument("--rate", type=int, default=48000, help="Expected sample rate (default: 48000)")
+    parser.add_argument("--bit-depth", type=int, default=24, help="Expected bit depth (default: 24)")
+    parser.add_argument("--quiet", action="store_true", default=False, help="Only list files with errors or warnings")
+    parser.add_argument("--json", type=str, default=None, metavar="PATH", help="Also write every report as JSON to PATH")
+    args = parser.parse_args()
+
+    paths = collect_wav_paths(args.sources)
+    if not paths:
+        parser.error("No WAV files found")
+    start = time.perf_counter()
+    reports = scan_library(paths, args.workers, args.rate, args.bit_depth)
+    elapsed = time.perf_counter() - start
+
+    for report in reports:
+        if not args.quiet or report["errors"] or report["warnings"]:
+            print(format_report(report))
+    failed = sum(not report["ok"] for report in reports)
+    warned = sum(report["ok"] and bool(report["warnings"]) for report in reports)
+    hours = sum(report.get("duration_seconds", 0) for report in reports) / 3600
+    print(f"{len(reports)} files ({hours:.1f} h of audio) scanned in {elapsed:.2f}s: "
+          f"{len(reports) - failed} analyzable ({warned} with warnings), {failed} with errors")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"elapsed_seconds": elapsed, "reports": reports}, f, indent=4)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()